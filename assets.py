@@ -0,0 +1,115 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+
+try:
+    import brotli
+except ImportError:  # optional, gzip is always built
+    brotli = None
+
+
+# Build step for static files: every asset is copied to static/dist/ with a
+# content hash in its name (css/styles.css -> dist/css/styles.1a2b3c4d5e6f.css)
+# and listed in dist/assets.json. Templates keep calling
+# url_for("static", filename="css/styles.css"); main.py swaps in the
+# fingerprinted name, which can then be cached forever.
+DIST_DIR = "dist"
+MANIFEST_NAME = "assets.json"
+HASH_LENGTH = 12
+# User uploads are content-addressed already. The PWA manifest resolves icon
+# paths relative to itself and the service worker needs a stable URL.
+EXCLUDED = ("uploads/", DIST_DIR + "/", "manifest.json", "js/serviceworker.js")
+COMPRESSIBLE = (".css", ".js", ".json", ".svg", ".html", ".txt")
+# App shell the service worker downloads on install
+PRECACHE = (
+    "css/styles.css",
+    "js/app.js",
+    "js/swup-init.js",
+    "js/signup.js",
+    "Images/logo.png",
+    "Images/favicon.png",
+    "Images/placeholder.png",
+)
+SERVICE_WORKER = "js/serviceworker.js"
+PRECACHE_PATTERN = re.compile(r"/\* precache \*/ \{.*?\}")
+
+
+def fingerprinted_name(path, content_hash):
+    stem, dot, ext = path.rpartition(".")
+    if not dot:
+        return f"{path}.{content_hash}"
+    return f"{stem}.{content_hash}.{ext}"
+
+
+def source_files(static_dir):
+    for root, dirs, files in os.walk(static_dir):
+        dirs.sort()
+        for filename in sorted(files):
+            if filename.startswith("."):
+                continue
+            path = os.path.relpath(os.path.join(root, filename), static_dir)
+            path = path.replace(os.sep, "/")
+            if not path.startswith(EXCLUDED):
+                yield path
+
+
+def build_assets(static_dir):
+    dist_dir = os.path.join(static_dir, DIST_DIR)
+    # Old builds are dropped; pages rendered before a deploy may briefly 404
+    # on their assets until they are reloaded
+    shutil.rmtree(dist_dir, ignore_errors=True)
+    manifest = {}
+    for path in source_files(static_dir):
+        with open(os.path.join(static_dir, path), "rb") as f:
+            data = f.read()
+        content_hash = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+        target = fingerprinted_name(path, content_hash)
+        target_path = os.path.join(dist_dir, target)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        with open(target_path, "wb") as f:
+            f.write(data)
+        if path.endswith(COMPRESSIBLE):
+            with open(target_path + ".gz", "wb") as f:
+                f.write(gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                with open(target_path + ".br", "wb") as f:
+                    f.write(brotli.compress(data))
+        manifest[path] = f"{DIST_DIR}/{target}"
+
+    with open(os.path.join(dist_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    build_service_worker(static_dir, manifest)
+    return manifest
+
+
+def build_service_worker(static_dir, manifest):
+    # The precache list only holds fingerprinted URLs, so its hash changes
+    # (and the worker installs a new cache) exactly when a shell file does
+    urls = [f"/static/{manifest[path]}" for path in PRECACHE if path in manifest]
+    version = hashlib.sha256("\n".join(urls).encode()).hexdigest()[:HASH_LENGTH]
+    with open(os.path.join(static_dir, SERVICE_WORKER)) as f:
+        source = f.read()
+    precache = json.dumps({"version": version, "urls": urls})
+    source = PRECACHE_PATTERN.sub(lambda m: precache, source, count=1)
+    with open(os.path.join(static_dir, DIST_DIR, "serviceworker.js"), "w") as f:
+        f.write(source)
+
+
+def service_worker_path(static_dir):
+    # Built worker if there is one, otherwise the source with an empty precache
+    built = os.path.join(static_dir, DIST_DIR, "serviceworker.js")
+    if os.path.exists(built):
+        return built
+    return os.path.join(static_dir, SERVICE_WORKER)
+
+
+def load_manifest(static_dir):
+    # No build yet (e.g. in development) means plain, unfingerprinted URLs
+    try:
+        with open(os.path.join(static_dir, DIST_DIR, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
@@ -0,0 +1,307 @@
+import argparse
+import logging
+import os
+import random
+import shutil
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import database_manager
+import geo
+
+# Load test for the main routes. Seeds a copy of the database with synthetic
+# users, donations, matches and notifications, then times the routes through
+# the Flask test client and through a local threaded HTTP server under
+# concurrent load, and prints p50/p95/p99 latency and throughput.
+#
+#   python benchmark.py --users 2000 --donations 20000 --concurrency 32
+#
+# Exits with status 1 when a route's p95 is over --target seconds (the README
+# asks for pages within 1.5s), so it can gate a deploy.
+SOURCE_DATABASE = "database/data_source.db"
+DEFAULT_DATABASE = "database/benchmark.db"
+ROUTES = ["/dashboard", "/donations", "/find_matches", "/matches", "/notifications"]
+CATEGORIES = ["Education", "Food", "Clothing", "Tech", "Medication", "Furniture"]
+STATUSES = ["Available"] * 6 + ["Pending", "Requested", "Donated", "Completed"]
+WORDS = [
+    "jacket", "books", "laptop", "rice", "chair", "blanket", "shoes", "table",
+    "pasta", "phone", "desk", "coat", "tins", "lamp", "cot", "pram", "kettle",
+]  # fmt: skip
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Seed synthetic data and load test the main routes."
+    )
+    parser.add_argument("--database", default=DEFAULT_DATABASE)
+    parser.add_argument(
+        "--reuse", action="store_true", help="skip seeding, reuse --database"
+    )
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--donations", type=int, default=10000)
+    parser.add_argument("--matches", type=int, default=5000)
+    parser.add_argument("--notifications", type=int, default=20, help="per user")
+    parser.add_argument("--requests", type=int, default=200, help="per route and phase")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--no-http", action="store_true", help="test client phase only")
+    parser.add_argument(
+        "--target", type=float, default=1.5, help="p95 limit in seconds"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+# ----------------- SEEDING -----------------
+def seed(db, args, rng):
+    from werkzeug.security import generate_password_hash
+
+    # Hashing is slow on purpose; every synthetic user shares one password
+    password = generate_password_hash("benchmark")
+    now = datetime.now()
+    locations = list(geo.LOCATIONS.items())
+
+    def timestamp(max_days):
+        moment = now - timedelta(seconds=rng.randrange(max_days * 86400))
+        return moment.strftime(database_manager.TIMESTAMP_FORMAT)
+
+    donors, recipients, users = [], [], []
+    for i in range(args.users):
+        user_id = str(uuid.uuid4())
+        role = "Donor" if i % 2 == 0 else "Recipient"
+        (donors if role == "Donor" else recipients).append(user_id)
+        label, (lat, lon) = rng.choice(locations)
+        users.append(
+            (user_id, f"Bench {i}", f"bench{i}@example.com", password, role,
+             timestamp(365), rng.random() < 0.5, label, lat, lon)
+        )  # fmt: skip
+    db.executemany(
+        """
+        INSERT INTO Users (user_id, name, email, password, role, creation_date,
+            public_profile, location, latitude, longitude)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        users,
+    )
+    db.executemany(
+        "INSERT INTO Preferences (user_id, category) VALUES (?, ?)",
+        [
+            (user_id, category)
+            for user_id in recipients
+            for category in rng.sample(CATEGORIES, 2)
+        ],
+    )
+
+    donations = []
+    for _ in range(args.donations):
+        status = rng.choice(STATUSES)
+        label, (lat, lon) = rng.choice(locations)
+        claimed_by = rng.choice(recipients) if status != "Available" else None
+        donations.append(
+            (rng.choice(donors), " ".join(rng.sample(WORDS, 2)), rng.choice(CATEGORIES),
+             status, timestamp(180), claimed_by, claimed_by, label, lat, lon)
+        )  # fmt: skip
+    db.executemany(
+        """
+        INSERT INTO Donations (donor_id, items, category, status, date_donated,
+            claimed_by, recipient_id, location, latitude, longitude)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        donations,
+    )
+    donation_ids = [row[0] for row in db.execute("SELECT donation_id FROM Donations")]
+
+    # OR IGNORE: a donation takes only one Pending/Accepted match
+    db.executemany(
+        "INSERT OR IGNORE INTO Matches (donation_id, recipient_id, status) VALUES (?, ?, ?)",
+        [
+            (rng.choice(donation_ids), rng.choice(recipients),
+             rng.choice(["Pending", "Pending", "Accepted", "Rejected", "Completed"]))
+            for _ in range(args.matches)
+        ],
+    )  # fmt: skip
+    db.executemany(
+        "INSERT INTO Notifications (id, user_id, message, created_at, read) VALUES (?, ?, ?, ?, ?)",
+        [
+            (str(uuid.uuid4()), user[0], "Benchmark notification",
+             (now - timedelta(minutes=rng.randrange(60 * 24 * 30))).isoformat(),
+             int(rng.random() < 0.7))
+            for user in users
+            for _ in range(args.notifications)
+        ],
+    )  # fmt: skip
+    db.commit()
+    return donors, recipients
+
+
+def benchmark_users(db, limit=200):
+    # A sample of synthetic accounts to sign requests in as
+    rows = db.execute(
+        "SELECT user_id, role FROM Users WHERE email LIKE 'bench%@example.com' LIMIT ?",
+        (limit,),
+    ).fetchall()
+    return [row["user_id"] for row in rows if row["role"] == "Donor"], [
+        row["user_id"] for row in rows if row["role"] == "Recipient"
+    ]
+
+
+# ----------------- MEASURING -----------------
+def percentile(sorted_values, pct):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(phase, route, latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "phase": phase,
+        "route": route,
+        "count": len(latencies),
+        "errors": errors,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": latencies[-1] if latencies else 0.0,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+    }
+
+
+def user_for(route, donors, recipients, rng):
+    # find_matches only serves recipients; everything else takes either
+    if route == "/find_matches":
+        return rng.choice(recipients)
+    return rng.choice(donors + recipients)
+
+
+def run_test_client(app, donors, recipients, args, rng):
+    results = []
+    client = app.test_client()
+    for route in ROUTES:
+        latencies, errors = [], 0
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            with client.session_transaction() as session:
+                session["user_id"] = user_for(route, donors, recipients, rng)
+            t0 = time.perf_counter()
+            response = client.get(route)
+            latencies.append(time.perf_counter() - t0)
+            if response.status_code != 200:
+                errors += 1
+        results.append(
+            summarize("client", route, latencies, errors, time.perf_counter() - started)
+        )
+    return results
+
+
+def run_http(app, donors, recipients, args, rng):
+    from werkzeug.serving import make_server
+
+    # One access log line per request would drown the report
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    # Signed session cookies, as the browser would send after signing in
+    serializer = app.session_interface.get_signing_serializer(app)
+    cookie_name = app.config["SESSION_COOKIE_NAME"]
+
+    def fetch(route, user_id):
+        request = urllib.request.Request(
+            base + route,
+            headers={
+                "Cookie": f"{cookie_name}={serializer.dumps({'user_id': user_id})}"
+            },
+        )
+        t0 = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+                ok = response.status == 200
+        except OSError:
+            ok = False
+        return time.perf_counter() - t0, ok
+
+    results = []
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            for route in ROUTES:
+                users = [
+                    user_for(route, donors, recipients, rng)
+                    for _ in range(args.requests)
+                ]
+                started = time.perf_counter()
+                outcomes = list(pool.map(lambda user_id: fetch(route, user_id), users))
+                elapsed = time.perf_counter() - started
+                results.append(
+                    summarize(
+                        f"http x{args.concurrency}",
+                        route,
+                        [latency for latency, ok in outcomes if ok],
+                        sum(1 for _, ok in outcomes if not ok),
+                        elapsed,
+                    )
+                )
+    finally:
+        server.shutdown()
+    return results
+
+
+def report(results, target):
+    print(
+        f"{'phase':<12}{'route':<16}{'n':>6}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'req/s':>9}"
+    )
+    slow = []
+    for r in results:
+        print(
+            f"{r['phase']:<12}{r['route']:<16}{r['count']:>6}{r['errors']:>5}"
+            f"{r['p50'] * 1000:>9.1f}{r['p95'] * 1000:>9.1f}{r['p99'] * 1000:>9.1f}"
+            f"{r['max'] * 1000:>9.1f}{r['rps']:>9.1f}"
+        )
+        if r["p95"] > target or r["errors"]:
+            slow.append(r)
+    for r in slow:
+        print(
+            f"FAIL {r['phase']} {r['route']}: p95 {r['p95']:.3f}s (limit {target}s), {r['errors']} errors",
+            file=sys.stderr,
+        )
+    return not slow
+
+
+# ----------------- run -----------------
+if __name__ == "__main__":
+    args = parse_args()
+    rng = random.Random(args.seed)
+
+    if not args.reuse:
+        # Never touch the real database: seed a fresh copy of it
+        shutil.copyfile(SOURCE_DATABASE, args.database)
+        for suffix in ("-wal", "-shm"):
+            if os.path.exists(args.database + suffix):
+                os.remove(args.database + suffix)
+    os.environ["GRATIA_DATABASE"] = args.database
+    os.environ.setdefault("GRATIA_JOB_WORKERS", "0")
+
+    # main reads the database path at import time and migrates it
+    import main
+
+    db = main.db_pool.acquire()
+    if not args.reuse:
+        t0 = time.perf_counter()
+        seed(db, args, rng)
+        print(f"seeded {args.database} in {time.perf_counter() - t0:.1f}s")
+    donors, recipients = benchmark_users(db)
+    main.db_pool.release(db)
+    if not donors or not recipients:
+        sys.exit("no benchmark users in the database, run without --reuse first")
+
+    results = run_test_client(main.app, donors, recipients, args, rng)
+    if not args.no_http:
+        results += run_http(main.app, donors, recipients, args, rng)
+    sys.exit(0 if report(results, args.target) else 1)
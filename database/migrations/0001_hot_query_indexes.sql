@@ -0,0 +1,30 @@
+-- Indexes for the lookups every authenticated page runs.
+-- Composite keys put the equality column first and carry the columns the
+-- route filters/aggregates on, so most of these are answered from the index.
+
+-- signin / forgot_password
+CREATE INDEX IF NOT EXISTS idx_users_email ON Users(email);
+
+-- dashboard (donor) stats + recent, my_donations
+CREATE INDEX IF NOT EXISTS idx_donations_donor_status ON Donations(donor_id, status);
+
+-- dashboard (recipient) stats + recent
+CREATE INDEX IF NOT EXISTS idx_donations_claimed_by_status ON Donations(claimed_by, status);
+
+-- my_requests
+CREATE INDEX IF NOT EXISTS idx_donations_recipient ON Donations(recipient_id);
+
+-- matches (recipient) and the find_matches NOT IN lookup
+CREATE INDEX IF NOT EXISTS idx_matches_recipient_donation ON Matches(recipient_id, donation_id);
+
+-- notification sidebar / feed, newest first
+CREATE INDEX IF NOT EXISTS idx_notifications_user_created ON Notifications(user_id, created_at);
+
+-- dashboard average rating
+CREATE INDEX IF NOT EXISTS idx_ratings_rated_rating ON Ratings(rated_id, rating);
+
+-- settings
+CREATE INDEX IF NOT EXISTS idx_preferences_user_category ON Preferences(user_id, category);
+
+-- reset_password
+CREATE INDEX IF NOT EXISTS idx_reset_tokens_hash ON PasswordResetTokens(token_hash);
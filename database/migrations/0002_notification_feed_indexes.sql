@@ -0,0 +1,7 @@
+-- Notification feed is paged newest first with a (created_at, id) cursor,
+-- id breaks ties between notifications created in the same instant.
+DROP INDEX IF EXISTS idx_notifications_user_created;
+CREATE INDEX IF NOT EXISTS idx_notifications_user_created ON Notifications(user_id, created_at, id);
+
+-- Unread badge counts only unread rows
+CREATE INDEX IF NOT EXISTS idx_notifications_user_read ON Notifications(user_id, read);
@@ -0,0 +1,31 @@
+-- Full-text index over the catalogue for donations_page search.
+-- External content: the text lives in Donations, the index only stores terms.
+-- prefix='2 3' keeps short prefix queries ("bo*") off the slow path.
+CREATE VIRTUAL TABLE IF NOT EXISTS DonationsSearch USING fts5(
+    items,
+    category,
+    content='Donations',
+    content_rowid='donation_id',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS donations_search_insert AFTER INSERT ON Donations BEGIN
+    INSERT INTO DonationsSearch (rowid, items, category)
+    VALUES (new.donation_id, new.items, new.category);
+END;
+
+CREATE TRIGGER IF NOT EXISTS donations_search_delete AFTER DELETE ON Donations BEGIN
+    INSERT INTO DonationsSearch (DonationsSearch, rowid, items, category)
+    VALUES ('delete', old.donation_id, old.items, old.category);
+END;
+
+CREATE TRIGGER IF NOT EXISTS donations_search_update AFTER UPDATE OF items, category ON Donations BEGIN
+    INSERT INTO DonationsSearch (DonationsSearch, rowid, items, category)
+    VALUES ('delete', old.donation_id, old.items, old.category);
+    INSERT INTO DonationsSearch (rowid, items, category)
+    VALUES (new.donation_id, new.items, new.category);
+END;
+
+-- Index the donations that already exist
+INSERT INTO DonationsSearch (DonationsSearch) VALUES ('rebuild');
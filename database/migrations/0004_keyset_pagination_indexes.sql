@@ -0,0 +1,8 @@
+-- Keyset pagination walks these orderings directly instead of sorting
+-- every matching row to find one page.
+
+-- my_donations: a donor's donations newest first (rowid is the trailing key)
+CREATE INDEX IF NOT EXISTS idx_donations_donor ON Donations(donor_id);
+
+-- find_matches: whole catalogue by date, newest first
+CREATE INDEX IF NOT EXISTS idx_donations_date ON Donations(date_donated);
@@ -0,0 +1,104 @@
+-- Matches.donation_id was TEXT while Donations.donation_id is INTEGER, so
+-- every join between them compared with numeric affinity and could not use
+-- an index on Matches.donation_id. Rebuild the table with an INTEGER key.
+CREATE TABLE Matches_new (
+    match_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    donation_id INTEGER NOT NULL,
+    recipient_id TEXT NOT NULL,
+    status TEXT DEFAULT 'Pending',  -- Pending / Accepted / Rejected / Completed
+    donor_completed INTEGER DEFAULT 0,  -- 0 = False, 1 = True
+    recipient_completed INTEGER DEFAULT 0,  -- 0 = False, 1 = True
+    FOREIGN KEY (donation_id) REFERENCES Donations(donation_id),
+    FOREIGN KEY (recipient_id) REFERENCES Users(user_id)
+);
+
+INSERT INTO Matches_new (match_id, donation_id, recipient_id, status, donor_completed, recipient_completed)
+SELECT match_id, CAST(donation_id AS INTEGER), recipient_id, status, donor_completed, recipient_completed
+FROM Matches;
+
+DROP TABLE Matches;
+ALTER TABLE Matches_new RENAME TO Matches;
+
+CREATE INDEX IF NOT EXISTS idx_matches_recipient_donation ON Matches(recipient_id, donation_id);
+CREATE INDEX IF NOT EXISTS idx_matches_donation_status ON Matches(donation_id, status);
+
+
+-- Donations a recipient can still ask for: not requested/donated yet and
+-- without an accepted or completed match. Kept up to date by the triggers
+-- below so find_matches never has to work this out per row.
+CREATE TABLE IF NOT EXISTS AvailableDonations (
+    donation_id INTEGER PRIMARY KEY,
+    donor_id TEXT,
+    date_donated TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_available_date ON AvailableDonations(date_donated);
+
+INSERT INTO AvailableDonations (donation_id, donor_id, date_donated)
+SELECT d.donation_id, d.donor_id, d.date_donated
+FROM Donations d
+WHERE (d.status IS NULL OR d.status IN ('Available', 'Pending'))
+    AND NOT EXISTS (
+        SELECT 1 FROM Matches m
+        WHERE m.donation_id = d.donation_id AND m.status IN ('Accepted', 'Completed')
+    );
+
+CREATE TRIGGER IF NOT EXISTS available_donation_insert AFTER INSERT ON Donations
+WHEN new.status IS NULL OR new.status IN ('Available', 'Pending')
+BEGIN
+    INSERT OR REPLACE INTO AvailableDonations (donation_id, donor_id, date_donated)
+    VALUES (new.donation_id, new.donor_id, new.date_donated);
+END;
+
+CREATE TRIGGER IF NOT EXISTS available_donation_update
+AFTER UPDATE OF status, donor_id, date_donated ON Donations
+BEGIN
+    DELETE FROM AvailableDonations WHERE donation_id = old.donation_id;
+    INSERT INTO AvailableDonations (donation_id, donor_id, date_donated)
+    SELECT new.donation_id, new.donor_id, new.date_donated
+    WHERE (new.status IS NULL OR new.status IN ('Available', 'Pending'))
+        AND NOT EXISTS (
+            SELECT 1 FROM Matches m
+            WHERE m.donation_id = new.donation_id AND m.status IN ('Accepted', 'Completed')
+        );
+END;
+
+CREATE TRIGGER IF NOT EXISTS available_donation_delete AFTER DELETE ON Donations
+BEGIN
+    DELETE FROM AvailableDonations WHERE donation_id = old.donation_id;
+END;
+
+-- A match changing state can take a donation off (or back onto) the list
+CREATE TRIGGER IF NOT EXISTS available_match_insert AFTER INSERT ON Matches
+WHEN new.status IN ('Accepted', 'Completed')
+BEGIN
+    DELETE FROM AvailableDonations WHERE donation_id = new.donation_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS available_match_update AFTER UPDATE OF status ON Matches
+BEGIN
+    DELETE FROM AvailableDonations WHERE donation_id = new.donation_id;
+    INSERT INTO AvailableDonations (donation_id, donor_id, date_donated)
+    SELECT d.donation_id, d.donor_id, d.date_donated
+    FROM Donations d
+    WHERE d.donation_id = new.donation_id
+        AND (d.status IS NULL OR d.status IN ('Available', 'Pending'))
+        AND NOT EXISTS (
+            SELECT 1 FROM Matches m
+            WHERE m.donation_id = d.donation_id AND m.status IN ('Accepted', 'Completed')
+        );
+END;
+
+CREATE TRIGGER IF NOT EXISTS available_match_delete AFTER DELETE ON Matches
+WHEN old.status IN ('Accepted', 'Completed')
+BEGIN
+    INSERT OR IGNORE INTO AvailableDonations (donation_id, donor_id, date_donated)
+    SELECT d.donation_id, d.donor_id, d.date_donated
+    FROM Donations d
+    WHERE d.donation_id = old.donation_id
+        AND (d.status IS NULL OR d.status IN ('Available', 'Pending'))
+        AND NOT EXISTS (
+            SELECT 1 FROM Matches m
+            WHERE m.donation_id = d.donation_id AND m.status IN ('Accepted', 'Completed')
+        );
+END;
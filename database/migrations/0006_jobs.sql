@@ -0,0 +1,16 @@
+-- Durable queue for work that happens after a request has committed
+-- (notification fan-out and similar side effects), see job_queue.py.
+CREATE TABLE IF NOT EXISTS Jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,  -- JSON
+    status TEXT NOT NULL DEFAULT 'queued',  -- queued / running / failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_after REAL NOT NULL,  -- unix time
+    claimed_at REAL,
+    last_error TEXT,
+    created_at REAL NOT NULL
+);
+
+-- Workers look for due work in id order
+CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after ON Jobs(status, run_after);
@@ -0,0 +1,6 @@
+-- Resized copies of a donation's image, as JSON written by the
+-- image_variants job: {"thumb": ..., "thumb_webp": ..., "large": ..., "large_webp": ...}
+ALTER TABLE Donations ADD COLUMN image_variants TEXT;
+
+-- The job updates every donation that shares the (content addressed) image
+CREATE INDEX IF NOT EXISTS idx_donations_image ON Donations(Image_URL);
@@ -0,0 +1,138 @@
+-- Dashboard counters, one row per user. The triggers below move the counts
+-- whenever a donation, claim or rating changes, so the dashboard reads a
+-- single row instead of aggregating the user's whole history.
+-- 'flask --app main user-stats' compares this table with a full recount.
+CREATE TABLE IF NOT EXISTS UserStats (
+    user_id TEXT PRIMARY KEY,
+    total_donations INTEGER NOT NULL DEFAULT 0,  -- as donor
+    requested_donations INTEGER NOT NULL DEFAULT 0,
+    completed_donations INTEGER NOT NULL DEFAULT 0,
+    total_claims INTEGER NOT NULL DEFAULT 0,  -- as recipient (Donations.claimed_by)
+    pending_claims INTEGER NOT NULL DEFAULT 0,
+    completed_claims INTEGER NOT NULL DEFAULT 0,
+    rating_count INTEGER NOT NULL DEFAULT 0,
+    rating_sum INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+INSERT INTO UserStats (
+    user_id, total_donations, requested_donations, completed_donations,
+    total_claims, pending_claims, completed_claims, rating_count, rating_sum
+)
+SELECT user_id, SUM(td), SUM(rd), SUM(cd), SUM(tc), SUM(pc), SUM(cc), SUM(rc), SUM(rs)
+FROM (
+    SELECT donor_id AS user_id, 1 AS td, status IS 'Requested' AS rd,
+        status IS 'Completed' AS cd, 0 AS tc, 0 AS pc, 0 AS cc, 0 AS rc, 0 AS rs
+    FROM Donations WHERE donor_id IS NOT NULL
+    UNION ALL
+    SELECT claimed_by, 0, 0, 0, 1, status IS 'Pending', status IS 'Completed', 0, 0
+    FROM Donations WHERE claimed_by IS NOT NULL
+    UNION ALL
+    SELECT rated_id, 0, 0, 0, 0, 0, 0, 1, rating
+    FROM Ratings WHERE rated_id IS NOT NULL AND rating IS NOT NULL
+)
+GROUP BY user_id;
+
+
+-- A donation counts for its donor and, once claimed, for its recipient.
+-- Updates take the old row's contribution away and add the new one.
+CREATE TRIGGER IF NOT EXISTS user_stats_donation_insert AFTER INSERT ON Donations
+BEGIN
+    INSERT INTO UserStats (user_id, total_donations, requested_donations, completed_donations)
+    SELECT new.donor_id, 1, new.status IS 'Requested', new.status IS 'Completed'
+    WHERE new.donor_id IS NOT NULL
+    ON CONFLICT (user_id) DO UPDATE SET
+        total_donations = total_donations + 1,
+        requested_donations = requested_donations + excluded.requested_donations,
+        completed_donations = completed_donations + excluded.completed_donations;
+
+    INSERT INTO UserStats (user_id, total_claims, pending_claims, completed_claims)
+    SELECT new.claimed_by, 1, new.status IS 'Pending', new.status IS 'Completed'
+    WHERE new.claimed_by IS NOT NULL
+    ON CONFLICT (user_id) DO UPDATE SET
+        total_claims = total_claims + 1,
+        pending_claims = pending_claims + excluded.pending_claims,
+        completed_claims = completed_claims + excluded.completed_claims;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_stats_donation_update
+AFTER UPDATE OF donor_id, claimed_by, status ON Donations
+BEGIN
+    UPDATE UserStats SET
+        total_donations = total_donations - 1,
+        requested_donations = requested_donations - (old.status IS 'Requested'),
+        completed_donations = completed_donations - (old.status IS 'Completed')
+    WHERE user_id = old.donor_id;
+
+    UPDATE UserStats SET
+        total_claims = total_claims - 1,
+        pending_claims = pending_claims - (old.status IS 'Pending'),
+        completed_claims = completed_claims - (old.status IS 'Completed')
+    WHERE user_id = old.claimed_by;
+
+    INSERT INTO UserStats (user_id, total_donations, requested_donations, completed_donations)
+    SELECT new.donor_id, 1, new.status IS 'Requested', new.status IS 'Completed'
+    WHERE new.donor_id IS NOT NULL
+    ON CONFLICT (user_id) DO UPDATE SET
+        total_donations = total_donations + 1,
+        requested_donations = requested_donations + excluded.requested_donations,
+        completed_donations = completed_donations + excluded.completed_donations;
+
+    INSERT INTO UserStats (user_id, total_claims, pending_claims, completed_claims)
+    SELECT new.claimed_by, 1, new.status IS 'Pending', new.status IS 'Completed'
+    WHERE new.claimed_by IS NOT NULL
+    ON CONFLICT (user_id) DO UPDATE SET
+        total_claims = total_claims + 1,
+        pending_claims = pending_claims + excluded.pending_claims,
+        completed_claims = completed_claims + excluded.completed_claims;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_stats_donation_delete AFTER DELETE ON Donations
+BEGIN
+    UPDATE UserStats SET
+        total_donations = total_donations - 1,
+        requested_donations = requested_donations - (old.status IS 'Requested'),
+        completed_donations = completed_donations - (old.status IS 'Completed')
+    WHERE user_id = old.donor_id;
+
+    UPDATE UserStats SET
+        total_claims = total_claims - 1,
+        pending_claims = pending_claims - (old.status IS 'Pending'),
+        completed_claims = completed_claims - (old.status IS 'Completed')
+    WHERE user_id = old.claimed_by;
+END;
+
+
+CREATE TRIGGER IF NOT EXISTS user_stats_rating_insert AFTER INSERT ON Ratings
+WHEN new.rated_id IS NOT NULL AND new.rating IS NOT NULL
+BEGIN
+    INSERT INTO UserStats (user_id, rating_count, rating_sum)
+    VALUES (new.rated_id, 1, new.rating)
+    ON CONFLICT (user_id) DO UPDATE SET
+        rating_count = rating_count + 1,
+        rating_sum = rating_sum + excluded.rating_sum;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_stats_rating_update AFTER UPDATE OF rated_id, rating ON Ratings
+BEGIN
+    UPDATE UserStats SET rating_count = rating_count - 1, rating_sum = rating_sum - old.rating
+    WHERE user_id = old.rated_id AND old.rating IS NOT NULL;
+
+    INSERT INTO UserStats (user_id, rating_count, rating_sum)
+    SELECT new.rated_id, 1, new.rating
+    WHERE new.rated_id IS NOT NULL AND new.rating IS NOT NULL
+    ON CONFLICT (user_id) DO UPDATE SET
+        rating_count = rating_count + 1,
+        rating_sum = rating_sum + excluded.rating_sum;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_stats_rating_delete AFTER DELETE ON Ratings
+WHEN old.rated_id IS NOT NULL AND old.rating IS NOT NULL
+BEGIN
+    UPDATE UserStats SET rating_count = rating_count - 1, rating_sum = rating_sum - old.rating
+    WHERE user_id = old.rated_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_stats_user_delete AFTER DELETE ON Users
+BEGIN
+    DELETE FROM UserStats WHERE user_id = old.user_id;
+END;
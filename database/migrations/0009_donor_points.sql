@@ -0,0 +1,64 @@
+-- Donation points and leaderboards. A donation earns its donor points on
+-- the day it is handed over (status Donated or Completed). DonorDailyPoints
+-- rolls those up per donor per day, so a weekly or monthly leaderboard adds
+-- up at most 31 rows per donor instead of grouping the Donations table.
+-- Points per donation must match POINTS_PER_DONATION in leaderboard.py.
+ALTER TABLE Donations ADD COLUMN completed_on TEXT;  -- YYYY-MM-DD (UTC)
+
+-- Older donations have no hand-over date; use the day they were listed
+UPDATE Donations
+SET completed_on = CASE
+    WHEN date_donated GLOB '[0-9][0-9]/[0-9][0-9]/[0-9][0-9]*'
+        THEN '20' || substr(date_donated, 7, 2) || '-' || substr(date_donated, 4, 2)
+            || '-' || substr(date_donated, 1, 2)
+    ELSE date('now')
+END
+WHERE status IN ('Donated', 'Completed');
+
+CREATE TABLE IF NOT EXISTS DonorDailyPoints (
+    day TEXT NOT NULL,  -- YYYY-MM-DD
+    user_id TEXT NOT NULL,
+    donations INTEGER NOT NULL DEFAULT 0,
+    points INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, user_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_donor_points_user ON DonorDailyPoints(user_id, day);
+
+INSERT INTO DonorDailyPoints (day, user_id, donations, points)
+SELECT completed_on, donor_id, COUNT(*), COUNT(*) * 10
+FROM Donations
+WHERE completed_on IS NOT NULL AND donor_id IS NOT NULL
+GROUP BY completed_on, donor_id;
+
+
+CREATE TRIGGER IF NOT EXISTS donor_points_complete AFTER UPDATE OF status ON Donations
+WHEN new.status IN ('Donated', 'Completed')
+    AND COALESCE(old.status, '') NOT IN ('Donated', 'Completed')
+BEGIN
+    UPDATE Donations SET completed_on = date('now') WHERE donation_id = new.donation_id;
+    INSERT INTO DonorDailyPoints (day, user_id, donations, points)
+    SELECT date('now'), new.donor_id, 1, 10
+    WHERE new.donor_id IS NOT NULL
+    ON CONFLICT (day, user_id) DO UPDATE SET
+        donations = donations + 1,
+        points = points + excluded.points;
+END;
+
+-- Moving a donation back out of Donated/Completed takes its points away
+-- from the day they were awarded
+CREATE TRIGGER IF NOT EXISTS donor_points_reopen AFTER UPDATE OF status ON Donations
+WHEN old.completed_on IS NOT NULL
+    AND COALESCE(new.status, '') NOT IN ('Donated', 'Completed')
+BEGIN
+    UPDATE DonorDailyPoints SET donations = donations - 1, points = points - 10
+    WHERE day = old.completed_on AND user_id = old.donor_id;
+    UPDATE Donations SET completed_on = NULL WHERE donation_id = new.donation_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS donor_points_delete AFTER DELETE ON Donations
+WHEN old.completed_on IS NOT NULL
+BEGIN
+    UPDATE DonorDailyPoints SET donations = donations - 1, points = points - 10
+    WHERE day = old.completed_on AND user_id = old.donor_id;
+END;
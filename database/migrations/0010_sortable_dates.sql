@@ -0,0 +1,25 @@
+-- Donations.date_donated and Users.creation_date were written as
+-- "dd/mm/yy HH:MM[:SS]", which sorts by day of month. Store them as
+-- "YYYY-MM-DD HH:MM:SS" (local time, like before) so text order is time
+-- order and date ranges can use an index.
+--
+-- This converts the formats the app itself wrote. Older imported rows
+-- (e.g. "7/28/2025") are left for 'flask --app main backfill-dates'.
+UPDATE Donations
+SET date_donated = '20' || substr(date_donated, 7, 2) || '-' || substr(date_donated, 4, 2)
+    || '-' || substr(date_donated, 1, 2) || ' ' || substr(date_donated, 10, 5) || ':00'
+WHERE date_donated GLOB '[0-9][0-9]/[0-9][0-9]/[0-9][0-9] [0-9][0-9]:[0-9][0-9]';
+
+UPDATE Donations
+SET date_donated = '20' || substr(date_donated, 7, 2) || '-' || substr(date_donated, 4, 2)
+    || '-' || substr(date_donated, 1, 2) || ' ' || substr(date_donated, 10, 8)
+WHERE date_donated GLOB '[0-9][0-9]/[0-9][0-9]/[0-9][0-9] [0-9][0-9]:[0-9][0-9]:[0-9][0-9]';
+
+UPDATE Users
+SET creation_date = '20' || substr(creation_date, 7, 2) || '-' || substr(creation_date, 4, 2)
+    || '-' || substr(creation_date, 1, 2) || ' ' || substr(creation_date, 10, 8)
+WHERE creation_date GLOB '[0-9][0-9]/[0-9][0-9]/[0-9][0-9] [0-9][0-9]:[0-9][0-9]:[0-9][0-9]';
+
+-- Donations(date_donated) already exists (0004); AvailableDonations copies
+-- are refreshed by the available_donation_update trigger
+CREATE INDEX IF NOT EXISTS idx_users_creation_date ON Users(creation_date);
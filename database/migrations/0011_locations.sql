@@ -0,0 +1,41 @@
+-- Pickup locations: users and donations carry a suburb label and its
+-- coordinates (see geo.py). Available donations that have a location are
+-- also kept in an R*Tree so radius searches start from a bounding box
+-- lookup instead of measuring the distance to every donation.
+ALTER TABLE Users ADD COLUMN location TEXT;
+ALTER TABLE Users ADD COLUMN latitude REAL;
+ALTER TABLE Users ADD COLUMN longitude REAL;
+
+ALTER TABLE Donations ADD COLUMN location TEXT;
+ALTER TABLE Donations ADD COLUMN latitude REAL;
+ALTER TABLE Donations ADD COLUMN longitude REAL;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS AvailableDonationLocations USING rtree(
+    donation_id,
+    min_lat, max_lat,
+    min_lon, max_lon
+);
+
+-- Follows AvailableDonations (migration 0005), whose triggers already
+-- decide when a donation can still be requested
+CREATE TRIGGER IF NOT EXISTS donation_location_available AFTER INSERT ON AvailableDonations
+BEGIN
+    INSERT OR REPLACE INTO AvailableDonationLocations (donation_id, min_lat, max_lat, min_lon, max_lon)
+    SELECT donation_id, latitude, latitude, longitude, longitude
+    FROM Donations
+    WHERE donation_id = new.donation_id AND latitude IS NOT NULL AND longitude IS NOT NULL;
+END;
+
+CREATE TRIGGER IF NOT EXISTS donation_location_unavailable AFTER DELETE ON AvailableDonations
+BEGIN
+    DELETE FROM AvailableDonationLocations WHERE donation_id = old.donation_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS donation_location_moved AFTER UPDATE OF latitude, longitude ON Donations
+BEGIN
+    DELETE FROM AvailableDonationLocations WHERE donation_id = old.donation_id;
+    INSERT INTO AvailableDonationLocations (donation_id, min_lat, max_lat, min_lon, max_lon)
+    SELECT new.donation_id, new.latitude, new.latitude, new.longitude, new.longitude
+    WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL
+        AND EXISTS (SELECT 1 FROM AvailableDonations WHERE donation_id = new.donation_id);
+END;
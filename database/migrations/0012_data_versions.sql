@@ -0,0 +1,24 @@
+-- A counter per table that cached pages depend on. Every write to the table
+-- bumps it in the same transaction, so a cache entry keyed on the version it
+-- was rendered at can never be served once the data under it has changed.
+CREATE TABLE IF NOT EXISTS DataVersions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+INSERT OR IGNORE INTO DataVersions (name) VALUES ('Donations');
+
+CREATE TRIGGER IF NOT EXISTS data_version_donation_insert AFTER INSERT ON Donations
+BEGIN
+    UPDATE DataVersions SET version = version + 1 WHERE name = 'Donations';
+END;
+
+CREATE TRIGGER IF NOT EXISTS data_version_donation_update AFTER UPDATE ON Donations
+BEGIN
+    UPDATE DataVersions SET version = version + 1 WHERE name = 'Donations';
+END;
+
+CREATE TRIGGER IF NOT EXISTS data_version_donation_delete AFTER DELETE ON Donations
+BEGIN
+    UPDATE DataVersions SET version = version + 1 WHERE name = 'Donations';
+END;
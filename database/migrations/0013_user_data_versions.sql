@@ -0,0 +1,198 @@
+-- A version per user, bumped whenever a row the user's pages show changes:
+-- their donations and matches (from either side), their notifications and
+-- ratings, their preferences and the names of the people they deal with.
+-- Conditional GETs compare it (see CONDITIONAL GET in main.py) instead of
+-- rebuilding the page. Users without a row are at version 0.
+CREATE TABLE IF NOT EXISTS UserDataVersions (
+    user_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+-- Matches feed find_matches (through AvailableDonations) for everyone
+INSERT OR IGNORE INTO DataVersions (name) VALUES ('Matches');
+
+
+-- Donations: donor, claimer and requester, plus everyone with a match on it
+CREATE TRIGGER IF NOT EXISTS user_version_donation_insert AFTER INSERT ON Donations
+BEGIN
+    INSERT INTO UserDataVersions (user_id, version)
+    SELECT user_id, 1 FROM (
+        SELECT new.donor_id AS user_id
+        UNION SELECT new.claimed_by
+        UNION SELECT new.recipient_id
+    )
+    WHERE user_id IS NOT NULL
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_version_donation_update AFTER UPDATE ON Donations
+BEGIN
+    INSERT INTO UserDataVersions (user_id, version)
+    SELECT user_id, 1 FROM (
+        SELECT old.donor_id AS user_id
+        UNION SELECT old.claimed_by
+        UNION SELECT old.recipient_id
+        UNION SELECT new.donor_id
+        UNION SELECT new.claimed_by
+        UNION SELECT new.recipient_id
+        UNION SELECT recipient_id FROM Matches WHERE donation_id = new.donation_id
+    )
+    WHERE user_id IS NOT NULL
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_version_donation_delete AFTER DELETE ON Donations
+BEGIN
+    INSERT INTO UserDataVersions (user_id, version)
+    SELECT user_id, 1 FROM (
+        SELECT old.donor_id AS user_id
+        UNION SELECT old.claimed_by
+        UNION SELECT old.recipient_id
+        UNION SELECT recipient_id FROM Matches WHERE donation_id = old.donation_id
+    )
+    WHERE user_id IS NOT NULL
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
+
+
+-- Matches: the recipient and the donor of the matched donation
+CREATE TRIGGER IF NOT EXISTS user_version_match_insert AFTER INSERT ON Matches
+BEGIN
+    INSERT INTO UserDataVersions (user_id, version)
+    SELECT user_id, 1 FROM (
+        SELECT new.recipient_id AS user_id
+        UNION SELECT donor_id FROM Donations WHERE donation_id = new.donation_id
+    )
+    WHERE user_id IS NOT NULL
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+
+    UPDATE DataVersions SET version = version + 1 WHERE name = 'Matches';
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_version_match_update AFTER UPDATE ON Matches
+BEGIN
+    INSERT INTO UserDataVersions (user_id, version)
+    SELECT user_id, 1 FROM (
+        SELECT old.recipient_id AS user_id
+        UNION SELECT new.recipient_id
+        UNION SELECT donor_id FROM Donations
+        WHERE donation_id IN (old.donation_id, new.donation_id)
+    )
+    WHERE user_id IS NOT NULL
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+
+    UPDATE DataVersions SET version = version + 1 WHERE name = 'Matches';
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_version_match_delete AFTER DELETE ON Matches
+BEGIN
+    INSERT INTO UserDataVersions (user_id, version)
+    SELECT user_id, 1 FROM (
+        SELECT old.recipient_id AS user_id
+        UNION SELECT donor_id FROM Donations WHERE donation_id = old.donation_id
+    )
+    WHERE user_id IS NOT NULL
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+
+    UPDATE DataVersions SET version = version + 1 WHERE name = 'Matches';
+END;
+
+
+-- Notifications, ratings and preferences belong to one or two users
+CREATE TRIGGER IF NOT EXISTS user_version_notification_insert AFTER INSERT ON Notifications
+WHEN new.user_id IS NOT NULL
+BEGIN
+    INSERT INTO UserDataVersions (user_id, version) VALUES (new.user_id, 1)
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_version_notification_update AFTER UPDATE ON Notifications
+BEGIN
+    INSERT INTO UserDataVersions (user_id, version)
+    SELECT user_id, 1 FROM (SELECT old.user_id AS user_id UNION SELECT new.user_id)
+    WHERE user_id IS NOT NULL
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_version_notification_delete AFTER DELETE ON Notifications
+WHEN old.user_id IS NOT NULL
+BEGIN
+    INSERT INTO UserDataVersions (user_id, version) VALUES (old.user_id, 1)
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_version_rating_insert AFTER INSERT ON Ratings
+BEGIN
+    INSERT INTO UserDataVersions (user_id, version)
+    SELECT user_id, 1 FROM (SELECT new.rater_id AS user_id UNION SELECT new.rated_id)
+    WHERE user_id IS NOT NULL
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_version_rating_update AFTER UPDATE ON Ratings
+BEGIN
+    INSERT INTO UserDataVersions (user_id, version)
+    SELECT user_id, 1 FROM (
+        SELECT old.rater_id AS user_id
+        UNION SELECT old.rated_id
+        UNION SELECT new.rater_id
+        UNION SELECT new.rated_id
+    )
+    WHERE user_id IS NOT NULL
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_version_rating_delete AFTER DELETE ON Ratings
+BEGIN
+    INSERT INTO UserDataVersions (user_id, version)
+    SELECT user_id, 1 FROM (SELECT old.rater_id AS user_id UNION SELECT old.rated_id)
+    WHERE user_id IS NOT NULL
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_version_preference_insert AFTER INSERT ON Preferences
+WHEN new.user_id IS NOT NULL
+BEGIN
+    INSERT INTO UserDataVersions (user_id, version) VALUES (new.user_id, 1)
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_version_preference_delete AFTER DELETE ON Preferences
+WHEN old.user_id IS NOT NULL
+BEGIN
+    INSERT INTO UserDataVersions (user_id, version) VALUES (old.user_id, 1)
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
+
+
+-- Users: the user themself, and on a name change everyone whose lists show it
+CREATE TRIGGER IF NOT EXISTS user_version_user_update AFTER UPDATE ON Users
+BEGIN
+    INSERT INTO UserDataVersions (user_id, version) VALUES (new.user_id, 1)
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_version_user_rename AFTER UPDATE OF name ON Users
+WHEN old.name IS NOT new.name
+BEGIN
+    INSERT INTO UserDataVersions (user_id, version)
+    SELECT user_id, 1 FROM (
+        SELECT recipient_id AS user_id FROM Donations WHERE donor_id = new.user_id
+        UNION SELECT claimed_by FROM Donations WHERE donor_id = new.user_id
+        UNION SELECT donor_id FROM Donations WHERE recipient_id = new.user_id
+        UNION SELECT donor_id FROM Donations WHERE claimed_by = new.user_id
+        UNION SELECT m.recipient_id FROM Matches m
+        JOIN Donations d ON d.donation_id = m.donation_id
+        WHERE d.donor_id = new.user_id
+        UNION SELECT d.donor_id FROM Matches m
+        JOIN Donations d ON d.donation_id = m.donation_id
+        WHERE m.recipient_id = new.user_id
+    )
+    WHERE user_id IS NOT NULL AND user_id <> new.user_id
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_version_user_delete AFTER DELETE ON Users
+BEGIN
+    DELETE FROM UserDataVersions WHERE user_id = old.user_id;
+END;
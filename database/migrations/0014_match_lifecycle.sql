@@ -0,0 +1,26 @@
+-- Match lifecycle (see match_lifecycle.py). A donation can have only one
+-- active (Pending or Accepted) match at a time. Where older data has more,
+-- the accepted one, or else the earliest, stays and the rest are rejected.
+UPDATE Matches SET status = 'Rejected'
+WHERE status IN ('Pending', 'Accepted')
+    AND match_id <> (
+        SELECT m.match_id FROM Matches m
+        WHERE m.donation_id = Matches.donation_id
+            AND m.status IN ('Pending', 'Accepted')
+        ORDER BY m.status = 'Accepted' DESC, m.match_id
+        LIMIT 1
+    );
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_matches_active_donation
+ON Matches(donation_id) WHERE status IN ('Pending', 'Accepted');
+
+-- Pending -> Accepted / Rejected, Accepted -> Completed; nothing else
+CREATE TRIGGER IF NOT EXISTS match_status_transition
+BEFORE UPDATE OF status ON Matches
+WHEN new.status IS NOT old.status AND NOT (
+    (old.status = 'Pending' AND new.status IN ('Accepted', 'Rejected'))
+    OR (old.status = 'Accepted' AND new.status = 'Completed')
+)
+BEGIN
+    SELECT RAISE(ABORT, 'invalid match status transition');
+END;
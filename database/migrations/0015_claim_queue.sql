@@ -0,0 +1,118 @@
+-- Waiting list per donation (see match_lifecycle.claim). Every claim is one
+-- insert here; the head of the queue becomes the donation's Pending match
+-- whenever the donation has no active match, so the first claimant goes
+-- straight through and the rest wait in order. position is a ticket number
+-- that only grows while the donation has people waiting.
+CREATE TABLE IF NOT EXISTS ClaimQueue (
+    donation_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    recipient_id TEXT NOT NULL,
+    queued_at TEXT NOT NULL,
+    PRIMARY KEY (donation_id, position),
+    UNIQUE (donation_id, recipient_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_claim_queue_recipient ON ClaimQueue(recipient_id);
+
+
+-- Promote the new claim right away when nobody holds the donation
+CREATE TRIGGER IF NOT EXISTS claim_queue_insert AFTER INSERT ON ClaimQueue
+WHEN NOT EXISTS (
+    SELECT 1 FROM Matches
+    WHERE donation_id = new.donation_id AND status IN ('Pending', 'Accepted')
+)
+BEGIN
+    INSERT INTO Matches (donation_id, recipient_id, status, donor_completed, recipient_completed)
+    VALUES (new.donation_id, new.recipient_id, 'Pending', 0, 0);
+
+    DELETE FROM ClaimQueue
+    WHERE donation_id = new.donation_id AND position = new.position;
+END;
+
+-- A rejected (or removed) claim hands the donation to the next in line.
+-- Only this donation's queue is read, in position order.
+CREATE TRIGGER IF NOT EXISTS claim_queue_promote_rejected
+AFTER UPDATE OF status ON Matches
+WHEN new.status = 'Rejected' AND old.status = 'Pending'
+BEGIN
+    INSERT INTO Matches (donation_id, recipient_id, status, donor_completed, recipient_completed)
+    SELECT donation_id, recipient_id, 'Pending', 0, 0
+    FROM ClaimQueue WHERE donation_id = new.donation_id
+    ORDER BY position LIMIT 1;
+
+    DELETE FROM ClaimQueue
+    WHERE donation_id = new.donation_id
+        AND position = (SELECT MIN(position) FROM ClaimQueue WHERE donation_id = new.donation_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS claim_queue_promote_deleted AFTER DELETE ON Matches
+WHEN old.status IN ('Pending', 'Accepted')
+BEGIN
+    INSERT INTO Matches (donation_id, recipient_id, status, donor_completed, recipient_completed)
+    SELECT donation_id, recipient_id, 'Pending', 0, 0
+    FROM ClaimQueue WHERE donation_id = old.donation_id
+    ORDER BY position LIMIT 1;
+
+    DELETE FROM ClaimQueue
+    WHERE donation_id = old.donation_id
+        AND position = (SELECT MIN(position) FROM ClaimQueue WHERE donation_id = old.donation_id);
+END;
+
+-- Accepting a claim hands the donation over to that recipient, as a direct
+-- request used to (my_donations / mark_donated / my_requests), but never a
+-- donation that is already requested or donated
+CREATE TRIGGER IF NOT EXISTS claim_accepted AFTER UPDATE OF status ON Matches
+WHEN new.status = 'Accepted' AND old.status = 'Pending'
+BEGIN
+    UPDATE Donations SET status = 'Requested', recipient_id = new.recipient_id
+    WHERE donation_id = new.donation_id
+        AND (status IS NULL OR status IN ('Available', 'Pending'));
+END;
+
+-- Nothing left to wait for once the donation is taken or gone
+CREATE TRIGGER IF NOT EXISTS claim_queue_donation_taken AFTER UPDATE OF status ON Donations
+WHEN new.status IS NOT NULL AND new.status NOT IN ('Available', 'Pending')
+BEGIN
+    DELETE FROM ClaimQueue WHERE donation_id = new.donation_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS claim_queue_donation_delete AFTER DELETE ON Donations
+BEGIN
+    DELETE FROM ClaimQueue WHERE donation_id = old.donation_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS claim_queue_user_delete AFTER DELETE ON Users
+BEGIN
+    DELETE FROM ClaimQueue WHERE recipient_id = old.user_id;
+END;
+
+-- Marking a donation as donated rejects the pending claim on it
+-- (match_lifecycle.mark_donated); close the ones older data left behind
+UPDATE Matches SET status = 'Rejected'
+WHERE status = 'Pending'
+    AND donation_id IN (
+        SELECT donation_id FROM Donations
+        WHERE status IS NOT NULL AND status NOT IN ('Available', 'Pending')
+    );
+
+-- A recipient's pages show their places in line (my_requests) and leave out
+-- donations they are waiting for (find_matches), so joining or leaving a
+-- ClaimQueue bumps their data version, and leaving also bumps everyone who
+-- moved up behind them (see migration 0013).
+CREATE TRIGGER IF NOT EXISTS user_version_claim_queue_insert AFTER INSERT ON ClaimQueue
+BEGIN
+    INSERT INTO UserDataVersions (user_id, version) VALUES (new.recipient_id, 1)
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_version_claim_queue_delete AFTER DELETE ON ClaimQueue
+BEGIN
+    INSERT INTO UserDataVersions (user_id, version)
+    SELECT user_id, 1 FROM (
+        SELECT old.recipient_id AS user_id
+        UNION SELECT recipient_id FROM ClaimQueue
+        WHERE donation_id = old.donation_id AND position > old.position
+    )
+    WHERE user_id IS NOT NULL
+    ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+END;
@@ -1,10 +1,413 @@
+import os
+import re
+import time
+import threading
+from datetime import datetime
 import sqlite3 as sql
 
+import queries
+from pagination import keyset_sql
+
+
+MIGRATIONS_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "database", "migrations"
+)
+
+# Migration scripts are named NNNN_description.sql and applied in number order
+MIGRATION_NAME = re.compile(r"^(\d{4})_([a-z0-9_]+)\.sql$")
+
 
 def listExtension():
     con = sql.connect("database/data_source.db")
     cur = con.cursor()
     data = cur.execute("SELECT * FROM extension").fetchall()
-    
+
     con.close()
     return data
+
+
+# ----------------- MIGRATIONS -----------------
+def list_migrations():
+    migrations = []
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = MIGRATION_NAME.match(filename)
+        if match:
+            migrations.append(
+                (int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, filename))
+            )
+    return sorted(migrations)
+
+
+def applied_versions(con):
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at INTEGER NOT NULL
+        )
+        """
+    )
+    return {row[0] for row in con.execute("SELECT version FROM schema_version")}
+
+
+def apply_migrations(con):
+    applied = applied_versions(con)
+    ran = []
+    for version, name, path in list_migrations():
+        if version in applied:
+            continue
+        with open(path) as f:
+            script = f.read()
+        # Each script runs in its own transaction together with its version row,
+        # so a failing migration leaves the schema exactly as it was
+        try:
+            con.executescript(
+                "BEGIN IMMEDIATE;\n"
+                + script
+                + f"\nINSERT INTO schema_version (version, name, applied_at) "
+                f"VALUES ({version}, '{name}', {int(time.time())});\nCOMMIT;"
+            )
+        except sql.Error:
+            if con.in_transaction:
+                con.execute("ROLLBACK")
+            raise
+        ran.append((version, name))
+    return ran
+
+
+# Its rows are converted by backfill_dates
+SORTABLE_DATES_MIGRATION = 10
+
+
+def migrate(path):
+    # Schema first, then, once, the rows migration 0010 expects in the
+    # sortable timestamp format. Rows it can't parse are left for
+    # 'flask --app main backfill-dates'.
+    con = sql.connect(path)
+    try:
+        ran = apply_migrations(con)
+        if any(version == SORTABLE_DATES_MIGRATION for version, _ in ran):
+            backfill_dates(con)
+        return ran
+    finally:
+        con.close()
+
+
+# ----------------- SEARCH INDEX -----------------
+def rebuild_search_index(con):
+    # Re-reads every donation into the full-text index, then merges its segments
+    con.execute("INSERT INTO DonationsSearch (DonationsSearch) VALUES ('rebuild')")
+    con.execute("INSERT INTO DonationsSearch (DonationsSearch) VALUES ('optimize')")
+    con.commit()
+    return con.execute("SELECT COUNT(*) FROM DonationsSearch").fetchone()[0]
+
+
+# ----------------- DATE BACKFILL -----------------
+# (table, key column, timestamp column) stored as "YYYY-MM-DD HH:MM:SS"
+DATE_COLUMNS = (
+    ("Donations", "donation_id", "date_donated"),
+    ("Users", "user_id", "creation_date"),
+)
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+TIMESTAMP_GLOB = "[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9] [0-9][0-9]:[0-9][0-9]:[0-9][0-9]"
+# Formats found in older rows. Four digit year dates came from a US
+# spreadsheet import (month first); two digit years are the app's own d/m/y.
+LEGACY_DATE_FORMATS = (
+    "%d/%m/%y %H:%M:%S",
+    "%d/%m/%y %H:%M",
+    "%m/%d/%Y %H:%M:%S",
+    "%m/%d/%Y",
+    "%Y-%m-%dT%H:%M:%S.%f",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%d",
+)
+
+
+def normalize_timestamp(value):
+    # Returns the value as "YYYY-MM-DD HH:MM:SS", or None if it can't be read
+    value = value.strip()
+    for date_format in LEGACY_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).strftime(TIMESTAMP_FORMAT)
+        except ValueError:
+            continue
+    return None
+
+
+def backfill_dates(con, batch_size=500):
+    # Rewrites every timestamp that is not in the sortable format yet, one
+    # committed batch at a time. Returns {table: converted} and the
+    # (table, key, value) rows that could not be parsed, which are left as is.
+    converted = {}
+    unparsed = []
+    for table, key, column in DATE_COLUMNS:
+        converted[table] = 0
+        last_key = None
+        while True:
+            query = (
+                f"SELECT {key}, {column} FROM {table} "
+                f"WHERE {column} IS NOT NULL AND {column} NOT GLOB ?"
+            )
+            params = [TIMESTAMP_GLOB]
+            if last_key is not None:
+                query += f" AND {key} > ?"
+                params.append(last_key)
+            query += f" ORDER BY {key} LIMIT ?"
+            params.append(batch_size)
+            rows = con.execute(query, params).fetchall()
+            if not rows:
+                break
+            updates = []
+            for row_key, value in rows:
+                normalized = normalize_timestamp(str(value))
+                if normalized is None:
+                    unparsed.append((table, row_key, value))
+                else:
+                    updates.append((normalized, row_key))
+            con.executemany(f"UPDATE {table} SET {column}=? WHERE {key}=?", updates)
+            con.commit()
+            converted[table] += len(updates)
+            last_key = rows[-1][0]
+    return converted, unparsed
+
+
+# ----------------- USER STATS -----------------
+# Full recount of what the UserStats triggers maintain incrementally
+USER_STATS_COLUMNS = (
+    "total_donations",
+    "requested_donations",
+    "completed_donations",
+    "total_claims",
+    "pending_claims",
+    "completed_claims",
+    "rating_count",
+    "rating_sum",
+)
+USER_STATS_RECOUNT = """
+    SELECT user_id, SUM(td) AS total_donations, SUM(rd) AS requested_donations,
+        SUM(cd) AS completed_donations, SUM(tc) AS total_claims,
+        SUM(pc) AS pending_claims, SUM(cc) AS completed_claims,
+        SUM(rc) AS rating_count, SUM(rs) AS rating_sum
+    FROM (
+        SELECT donor_id AS user_id, 1 AS td, status IS 'Requested' AS rd,
+            status IS 'Completed' AS cd, 0 AS tc, 0 AS pc, 0 AS cc, 0 AS rc, 0 AS rs
+        FROM Donations WHERE donor_id IS NOT NULL
+        UNION ALL
+        SELECT claimed_by, 0, 0, 0, 1, status IS 'Pending', status IS 'Completed', 0, 0
+        FROM Donations WHERE claimed_by IS NOT NULL
+        UNION ALL
+        SELECT rated_id, 0, 0, 0, 0, 0, 0, 1, rating
+        FROM Ratings WHERE rated_id IS NOT NULL AND rating IS NOT NULL
+    )
+    GROUP BY user_id
+"""
+
+
+def check_user_stats(con):
+    # Returns (user_id, column, stored, recounted) for every counter that drifted
+    con.row_factory = sql.Row
+    stored = {
+        row["user_id"]: row for row in con.execute("SELECT * FROM UserStats")
+    }
+    recounted = {row["user_id"]: row for row in con.execute(USER_STATS_RECOUNT)}
+    problems = []
+    for user_id in sorted(stored.keys() | recounted.keys()):
+        for column in USER_STATS_COLUMNS:
+            have = stored[user_id][column] if user_id in stored else 0
+            want = recounted[user_id][column] if user_id in recounted else 0
+            if have != want:
+                problems.append((user_id, column, have, want))
+    return problems
+
+
+def rebuild_user_stats(con):
+    columns = ", ".join(USER_STATS_COLUMNS)
+    con.execute("BEGIN IMMEDIATE")
+    con.execute("DELETE FROM UserStats")
+    con.execute(
+        f"INSERT INTO UserStats (user_id, {columns}) "
+        f"SELECT user_id, {columns} FROM ({USER_STATS_RECOUNT})"
+    )
+    con.execute("COMMIT")
+    return con.execute("SELECT COUNT(*) FROM UserStats").fetchone()[0]
+
+
+# ----------------- DATA VERSIONS -----------------
+# Bumped by triggers on every write to the table (migration 0012)
+def data_version(con, name):
+    row = con.execute(queries.DATA_VERSION, (name,)).fetchone()
+    return row[0] if row else 0
+
+
+# Bumped by triggers on every write that shows up on the user's pages
+# (migration 0013)
+def user_data_version(con, user_id):
+    row = con.execute(queries.USER_DATA_VERSION, (user_id,)).fetchone()
+    return row[0] if row else 0
+
+
+# ----------------- QUERY PLAN CHECK -----------------
+def listing_sql(listing, *extra_conditions, seek=True):
+    # A keyset listing from queries as keyset_page runs it: past the first
+    # page (seek) and with any optional filters the route adds
+    listing = dict(listing, conditions=listing["conditions"] + list(extra_conditions))
+    return keyset_sql(**listing, seek=seek)
+
+
+# (name, sql, tables that are allowed to be scanned). Built from the same
+# statements the routes run (queries.py).
+HOT_QUERIES = [
+    ("current_user", queries.USER_BY_ID, ()),
+    ("signin / forgot_password", queries.USER_BY_EMAIL, ()),
+    ("reset_password", queries.RESET_TOKEN, ()),
+    ("dashboard stats", queries.USER_STATS, ()),
+    ("data version", queries.DATA_VERSION, ()),
+    ("user data version", queries.USER_DATA_VERSION, ()),
+    ("dashboard donor recent", queries.DONOR_RECENT, ()),
+    ("dashboard recipient recent", queries.RECIPIENT_RECENT, ()),
+    ("my_donations page", listing_sql(queries.MY_DONATIONS), ()),
+    ("my_requests page", listing_sql(queries.MY_REQUESTS), ()),
+    ("matches recipient", queries.RECIPIENT_MATCHES, ()),
+    ("matches donor", queries.DONOR_MATCHES, ()),
+    ("find_matches page", listing_sql(queries.FIND_MATCHES), ()),
+    (
+        "find_matches last N days",
+        listing_sql(queries.FIND_MATCHES, queries.FIND_MATCHES_SINCE, seek=False),
+        (),
+    ),
+    ("donations catalogue page", listing_sql(queries.CATALOGUE), ()),
+    (
+        "donations catalogue last N days",
+        listing_sql(queries.CATALOGUE, queries.CATALOGUE_SINCE, seek=False),
+        (),
+    ),
+    (
+        "donations search",
+        listing_sql(queries.CATALOGUE_SEARCH),
+        # a MATCH is answered by the full-text index, it reports as a virtual table scan
+        ("DonationsSearch",),
+    ),
+    ("notifications first page", queries.NOTIFICATION_FEED, ()),
+    ("notifications older page", queries.NOTIFICATION_FEED_OLDER, ()),
+    ("notifications after", queries.NOTIFICATIONS_AFTER, ()),
+    ("notifications unread", queries.UNREAD_NOTIFICATIONS, ()),
+    ("settings preferences", queries.PREFERENCES, ()),
+    (
+        "nearby donations",
+        queries.NEARBY_DONATIONS,
+        # the R*Tree answers the box constraints, it reports as a virtual table scan
+        ("AvailableDonationLocations",),
+    ),
+    ("leaderboard top", queries.TOP_DONORS, ()),
+    ("donor points", queries.USER_POINTS, ()),
+    ("match respond", queries.MATCH_RESPOND, ()),
+    ("claim queue place", queries.PLACE_IN_LINE, ()),
+    ("my queued claims", queries.QUEUED_CLAIMS, ()),
+]
+
+
+def query_plan(con, query):
+    params = (None,) * query.count("?")
+    return [row[3] for row in con.execute("EXPLAIN QUERY PLAN " + query, params)]
+
+
+def check_query_plans(con):
+    # Returns (name, plan step) for every hot query that has to scan a table
+    problems = []
+    for name, query, allowed_scans in HOT_QUERIES:
+        for detail in query_plan(con, query):
+            words = detail.split()
+            # "SCAN (subquery-N)" walks an already bounded intermediate result
+            if words[0] != "SCAN" or words[1].startswith("("):
+                continue
+            if words[1] not in allowed_scans:
+                problems.append((name, detail))
+    return problems
+
+
+# ----------------- CONNECTION POOL -----------------
+# Applied to every pooled connection. WAL lets readers keep going while a
+# request commits, and synchronous=NORMAL is durable enough in WAL mode
+# (only the last commits can be lost on power failure, never corruption).
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",  # KiB, ~16MB page cache per connection
+    "PRAGMA mmap_size=134217728",  # 128MB
+    "PRAGMA temp_store=MEMORY",
+)
+BUSY_TIMEOUT = 5  # seconds a writer waits for the lock before "database is locked"
+STATEMENT_CACHE_SIZE = 256  # routes use a few dozen distinct statements
+MAX_IDLE_CONNECTIONS = 16
+
+
+class ConnectionPool:
+    def __init__(self, path, max_idle=MAX_IDLE_CONNECTIONS, factory=sql.Connection):
+        self.path = path
+        self.max_idle = max_idle
+        self.factory = factory
+        self.in_use = 0
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def connect(self):
+        # check_same_thread=False: a connection can be handed out to any
+        # request thread, but only ever to one request at a time
+        con = sql.connect(
+            self.path,
+            timeout=BUSY_TIMEOUT,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            factory=self.factory,
+        )
+        con.row_factory = sql.Row
+        for pragma in CONNECTION_PRAGMAS:
+            con.execute(pragma)
+        return con
+
+    def acquire(self):
+        with self._lock:
+            # Connections must not be shared with a forked worker process
+            if self._pid != os.getpid():
+                self._idle = []
+                self.in_use = 0
+                self._pid = os.getpid()
+            con = self._idle.pop() if self._idle else None
+            self.in_use += 1
+        if con is None:
+            try:
+                con = self.connect()
+            except sql.Error:
+                with self._lock:
+                    self.in_use -= 1
+                raise
+        return con
+
+    def release(self, con):
+        try:
+            # Never hand out a connection with a half finished transaction
+            if con.in_transaction:
+                con.rollback()
+        except sql.Error:
+            con.close()
+            con = None
+        with self._lock:
+            self.in_use -= 1
+            if con is not None and len(self._idle) < self.max_idle:
+                self._idle.append(con)
+                con = None
+        if con is not None:
+            con.close()
+
+    def idle_count(self):
+        with self._lock:
+            return len(self._idle)
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for con in idle:
+            con.close()
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+# Rendered HTML fragments, keyed on everything the fragment depends on plus
+# the data version of the tables it reads (DataVersions, migration 0012).
+# A write bumps the version in the same transaction, so entries for older
+# versions are simply never asked for again and age out of the LRU.
+#
+# One worker keeps its fragments in memory. With several worker processes set
+# GRATIA_FRAGMENT_CACHE_DIR to a directory they share (local disk, e.g. under
+# /tmp or /dev/shm) so a fragment rendered by one worker serves all of them.
+CACHE_DIR = os.environ.get("GRATIA_FRAGMENT_CACHE_DIR")
+MAX_BYTES = int(os.environ.get("GRATIA_FRAGMENT_CACHE_BYTES", str(8 * 1024 * 1024)))
+
+
+def entry_size(value):
+    return len(value.encode("utf-8"))
+
+
+class MemoryStore:
+    # Least recently used fragments are dropped once the total is over max_bytes
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value):
+        size = entry_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, dropped) = self._entries.popitem(last=False)
+                self.size -= dropped
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class DirectoryStore:
+    # One file per fragment, named by a hash of its key. Reading a file bumps
+    # its mtime, and once max_bytes / 8 has been written since the last check
+    # the oldest files are removed until the directory is under max_bytes.
+    def __init__(self, directory, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._written = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest + ".html")
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                value = f.read()
+            os.utime(path)
+        except OSError:
+            return None  # missing, or pruned by another worker meanwhile
+        return value
+
+    def set(self, key, value):
+        size = entry_size(value)
+        if size > self.max_bytes:
+            return
+        path = self.path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(value)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._written += size
+            if self._written < self.max_bytes // 8:
+                return
+            self._written = 0
+        self.prune()
+
+    def prune(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".html"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".html"):
+                os.remove(entry.path)
+
+
+def make_store():
+    if CACHE_DIR:
+        return DirectoryStore(CACHE_DIR)
+    return MemoryStore()
+
+
+class FragmentCache:
+    def __init__(self, store=None):
+        self.store = store if store is not None else make_store()
+
+    def get_or_render(self, key, render):
+        # (html, hit)
+        value = self.store.get(key)
+        if value is not None:
+            return value, True
+        value = str(render())
+        self.store.set(key, value)
+        return value, False
+
@@ -0,0 +1,107 @@
+import heapq
+import math
+
+import queries
+
+# Pickup locations are suburbs from AU_SUBURBS (main.py), stored on users and
+# donations as "Suburb, City" plus the suburb's centre point. Available
+# donations with a location are also kept in the AvailableDonationLocations
+# R*Tree (migration 0011), so "within N km" first narrows the search to a
+# bounding box through the index and only measures distance for those rows.
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE_LAT = 111.32
+DEFAULT_RADIUS_KM = 10
+MAX_RADIUS_KM = 100
+
+SUBURB_COORDINATES = {
+    ("Sydney", "Bondi"): (-33.8915, 151.2767),
+    ("Sydney", "Manly"): (-33.7969, 151.2850),
+    ("Sydney", "Parramatta"): (-33.8150, 151.0011),
+    ("Sydney", "Chatswood"): (-33.7969, 151.1803),
+    ("Melbourne", "Fitzroy"): (-37.7980, 144.9780),
+    ("Melbourne", "St Kilda"): (-37.8676, 144.9809),
+    ("Melbourne", "South Yarra"): (-37.8380, 144.9920),
+    ("Melbourne", "Brunswick"): (-37.7670, 144.9600),
+    ("Brisbane", "Fortitude Valley"): (-27.4570, 153.0340),
+    ("Brisbane", "South Bank"): (-27.4790, 153.0230),
+    ("Brisbane", "West End"): (-27.4820, 153.0120),
+    ("Perth", "Fremantle"): (-32.0569, 115.7439),
+    ("Perth", "Subiaco"): (-31.9490, 115.8260),
+    ("Perth", "Cottesloe"): (-31.9950, 115.7560),
+    ("Adelaide", "North Adelaide"): (-34.9070, 138.5930),
+    ("Adelaide", "Glenelg"): (-34.9800, 138.5130),
+    ("Adelaide", "Norwood"): (-34.9210, 138.6300),
+}
+
+
+def location_label(city, suburb):
+    return f"{suburb}, {city}"
+
+
+LOCATIONS = {
+    location_label(city, suburb): point
+    for (city, suburb), point in SUBURB_COORDINATES.items()
+}
+
+
+def parse_location(label):
+    # "Suburb, City" -> (label, lat, lon); anything unknown -> (None, None, None)
+    point = LOCATIONS.get(label or "")
+    if point is None:
+        return None, None, None
+    return label, point[0], point[1]
+
+
+def radius_km(value, default=DEFAULT_RADIUS_KM):
+    try:
+        km = float(value)
+    except (TypeError, ValueError):
+        return default
+    if not math.isfinite(km):
+        return default
+    return max(1.0, min(km, MAX_RADIUS_KM))
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    # Haversine great-circle distance
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = (
+        math.sin(dphi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def bounding_box(lat, lon, km):
+    # (min_lat, max_lat, min_lon, max_lon) around every point within km
+    dlat = km / KM_PER_DEGREE_LAT
+    dlon = km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 0.01))
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+def nearby_donations(db, lat, lon, km, limit, recipient_id=None):
+    # Available donations within km of (lat, lon), nearest first. With a
+    # recipient_id, donations that recipient already asked for or is waiting
+    # in line for are left out.
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, km)
+    rows = db.execute(
+        queries.NEARBY_DONATIONS,
+        (recipient_id, min_lat, max_lat, min_lon, max_lon, recipient_id),
+    ).fetchall()
+
+    # The box has corners further away than km; measure each candidate
+    candidates = []
+    for row in rows:
+        distance = distance_km(lat, lon, row["latitude"], row["longitude"])
+        if distance <= km:
+            candidates.append((distance, row["donation_id"], row))
+    nearest = heapq.nsmallest(limit, candidates, key=lambda c: (c[0], c[1]))
+    # Plain dicts so the distance can ride along; keys are lower-cased to
+    # keep row["image_url"] working as it does on sqlite3.Row
+    return [
+        {key.lower(): row[key] for key in row.keys()}
+        | {"distance_km": round(distance, 1)}
+        for distance, _, row in nearest
+    ]
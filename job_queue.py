@@ -0,0 +1,204 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import traceback
+
+
+# Side effects that don't have to finish before the response (notification
+# fan-out and the like) are queued as rows in the Jobs table and run by
+# background worker threads.
+#
+# enqueue() writes the job with the request's own connection, so the job is
+# committed together with the change that caused it, and never without it.
+# Once that commit is done, wake() lets an idle worker pick it up straight
+# away instead of at its next poll.
+# A worker claims a batch of due jobs, runs them all in one transaction
+# (one commit for the whole batch) and deletes the ones that succeeded.
+# Failed jobs are retried with exponential backoff, up to MAX_ATTEMPTS.
+BATCH_SIZE = 50
+POLL_INTERVAL = 1.0  # seconds a worker sleeps when nothing is due
+LEASE_SECONDS = 60  # a claimed job not finished by then is claimed again
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 2  # seconds, doubled after every failed attempt
+
+log = logging.getLogger(__name__)
+
+
+class JobQueue:
+    def __init__(self, pool, workers=1):
+        self.pool = pool
+        self.workers = workers
+        self._handlers = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def handler(self, kind):
+        def register(f):
+            self._handlers[kind] = f
+            return f
+
+        return register
+
+    def enqueue(self, db, kind, payload, delay=0):
+        # Not committed here: the caller commits it along with its own writes
+        now = time.time()
+        db.execute(
+            "INSERT INTO Jobs (kind, payload, run_after, created_at) VALUES (?, ?, ?, ?)",
+            (kind, json.dumps(payload), now + delay, now),
+        )
+
+    def wake(self):
+        # Call after committing enqueued jobs; woken any earlier, a worker
+        # would not see them yet and sleep until the next poll
+        self._wake.set()
+
+    # ----------------- workers -----------------
+    def start(self):
+        with self._lock:
+            # Threads don't survive a fork, each worker process starts its own
+            if self._pid == os.getpid() or self.workers < 1:
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._threads = [
+                threading.Thread(target=self.work, name=f"job-worker-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._pid = None
+
+    def work(self):
+        # Worker loop; also usable on its own in a dedicated process
+        while not self._stop.is_set():
+            try:
+                ran = self.run_pending()
+            except sqlite3.Error:
+                log.exception("job worker could not reach the database")
+                ran = 0
+            if not ran:
+                self._wake.wait(POLL_INTERVAL)
+                self._wake.clear()
+
+    # ----------------- running jobs -----------------
+    def run_pending(self, limit=BATCH_SIZE):
+        con = self.pool.acquire()
+        try:
+            jobs = self._claim(con, limit)
+            if not jobs:
+                return 0
+            after_commit = self._execute(con, jobs)
+        finally:
+            self.pool.release(con)
+        for callback in after_commit:
+            try:
+                callback()
+            except Exception:
+                log.exception("job after-commit callback failed")
+        return len(jobs)
+
+    def drain(self, timeout=10):
+        # Run everything that is due now and wait for jobs other threads have
+        # claimed, so tests can assert on the side effects of a request
+        deadline = time.monotonic() + timeout
+        while True:
+            if not self.run_pending() and not self.running_count():
+                return
+            if time.monotonic() > deadline:
+                raise TimeoutError("job queue did not drain")
+            time.sleep(0.01)
+
+    def running_count(self):
+        con = self.pool.acquire()
+        try:
+            return con.execute(
+                "SELECT COUNT(*) FROM Jobs WHERE status='running' AND claimed_at>=?",
+                (time.time() - LEASE_SECONDS,),
+            ).fetchone()[0]
+        finally:
+            self.pool.release(con)
+
+    def depth(self):
+        con = self.pool.acquire()
+        try:
+            return con.execute(
+                "SELECT COUNT(*) FROM Jobs WHERE status IN ('queued', 'running')"
+            ).fetchone()[0]
+        finally:
+            self.pool.release(con)
+
+    def _claim(self, con, limit):
+        now = time.time()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            rows = con.execute(
+                """
+                UPDATE Jobs SET status='running', claimed_at=?, attempts=attempts+1
+                WHERE id IN (
+                    SELECT id FROM Jobs WHERE status='queued' AND run_after<=?
+                    UNION ALL
+                    SELECT id FROM Jobs WHERE status='running' AND claimed_at<?
+                    ORDER BY id
+                    LIMIT ?
+                )
+                RETURNING id, kind, payload, attempts
+                """,
+                (now, now, now - LEASE_SECONDS, limit),
+            ).fetchall()
+            con.commit()
+        except sqlite3.Error:
+            con.rollback()
+            raise
+        return sorted(rows, key=lambda row: row["id"])
+
+    def _execute(self, con, jobs):
+        after_commit = []
+        con.execute("BEGIN")
+        try:
+            for job in jobs:
+                # Each job gets a savepoint so a failing one only undoes itself
+                con.execute("SAVEPOINT job")
+                try:
+                    handler = self._handlers[job["kind"]]
+                    callback = handler(con, json.loads(job["payload"]))
+                except Exception:
+                    con.execute("ROLLBACK TO job")
+                    con.execute("RELEASE job")
+                    self._failed(con, job, traceback.format_exc(limit=5))
+                    continue
+                con.execute("RELEASE job")
+                con.execute("DELETE FROM Jobs WHERE id=?", (job["id"],))
+                if callback:
+                    after_commit.append(callback)
+            con.commit()
+        except sqlite3.Error:
+            con.rollback()
+            raise
+        return after_commit
+
+    def _failed(self, con, job, error):
+        log.warning("job %s (%s) failed on attempt %s", job["id"], job["kind"], job["attempts"])
+        if job["attempts"] >= MAX_ATTEMPTS or job["kind"] not in self._handlers:
+            con.execute(
+                "UPDATE Jobs SET status='failed', last_error=? WHERE id=?",
+                (error, job["id"]),
+            )
+        else:
+            delay = RETRY_DELAY * 2 ** (job["attempts"] - 1)
+            con.execute(
+                "UPDATE Jobs SET status='queued', run_after=?, last_error=? WHERE id=?",
+                (time.time() + delay, error, job["id"]),
+            )
@@ -0,0 +1,78 @@
+import threading
+import time
+from datetime import timedelta
+
+import queries
+
+# Weekly and monthly donor rankings, read from the per donor per day rollup
+# in DonorDailyPoints (migration 0009) rather than from Donations.
+#
+# Each (period, bucket) top list is cached by this process. Completing a
+# donation here drops the cached buckets for that day straight away; changes
+# made by other workers show up once CACHE_TTL runs out.
+POINTS_PER_DONATION = 10  # also hard-coded in the 0009 triggers
+TOP_N = 10
+CACHE_TTL = 60  # seconds
+PERIODS = ("weekly", "monthly")
+
+def bucket_for(period, day):
+    # (first day of the bucket holding day, first day of the next bucket)
+    if period == "weekly":
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=7)
+    start = day.replace(day=1)
+    return start, (start + timedelta(days=32)).replace(day=1)
+
+
+class Leaderboard:
+    def __init__(self, size=TOP_N, ttl=CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._cache = {}  # (period, bucket start) -> (loaded_at, rows)
+        self._lock = threading.Lock()
+
+    def top(self, db, period, day):
+        start, end = bucket_for(period, day)
+        key = (period, start)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached and now - cached[0] < self.ttl:
+            return cached[1]
+
+        rows = db.execute(
+            queries.TOP_DONORS, (start.isoformat(), end.isoformat(), self.size)
+        ).fetchall()
+        rows = [dict(row) for row in rows]
+        with self._lock:
+            # Expired buckets are dropped here so old periods don't pile up
+            for old_key in [
+                k
+                for k, (loaded_at, _) in self._cache.items()
+                if now - loaded_at >= self.ttl
+            ]:
+                del self._cache[old_key]
+            self._cache[key] = (now, rows)
+        return rows
+
+    def invalidate(self, day):
+        with self._lock:
+            for period in PERIODS:
+                self._cache.pop((period, bucket_for(period, day)[0]), None)
+
+
+def user_points(db, user_id, day):
+    # All time, this week's and this month's points for one donor
+    week_start, week_end = bucket_for("weekly", day)
+    month_start, month_end = bucket_for("monthly", day)
+    row = db.execute(
+        queries.USER_POINTS,
+        (
+            week_start.isoformat(),
+            week_end.isoformat(),
+            month_start.isoformat(),
+            month_end.isoformat(),
+            user_id,
+        ),
+    ).fetchone()
+    return dict(row)
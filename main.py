@@ -5,7 +5,25 @@ import re
 import os
 import secrets
 import time
-from werkzeug.utils import secure_filename
+import json
+import mimetypes
+import queue
+import threading
+import click
+import database_manager
+from notification_bus import NotificationBus
+from matching import CategoryIndex
+from job_queue import JobQueue
+from leaderboard import Leaderboard, PERIODS, user_points
+from fragment_cache import FragmentCache
+import uploads
+import profiling
+import metrics
+import geo
+import match_lifecycle
+import assets
+import queries
+from pagination import Page, keyset_page, page_limit
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask import (
     Flask,
@@ -18,9 +36,12 @@ from flask import (
     session,
     current_app,
     jsonify,
+    send_from_directory,
 )
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from functools import wraps
+from collections import OrderedDict
+from markupsafe import Markup
 
 
 class User:
@@ -40,6 +61,10 @@ class User:
         self.public_profile = (
             bool(row["public_profile"]) if "public_profile" in row.keys() else False
         )
+        # Pickup location ("Suburb, City") and its coordinates, see geo.py
+        self.location = row["location"] if "location" in row.keys() else None
+        self.latitude = row["latitude"] if "latitude" in row.keys() else None
+        self.longitude = row["longitude"] if "longitude" in row.keys() else None
 
     # Save profile & preferences to DB
     def save(self):
@@ -59,12 +84,15 @@ class User:
             ),
         )
         db.commit()
+        invalidate_user(self.user_id)
 
     # Delete user
     def delete(self):
         db = get_db()
         db.execute("DELETE FROM Users WHERE user_id=?", (self.user_id,))
         db.commit()
+        invalidate_user(self.user_id)
+        g.pop("_current_user", None)
 
 AU_SUBURBS = {
     "Sydney": ["Bondi", "Manly", "Parramatta", "Chatswood"],
@@ -75,28 +103,321 @@ AU_SUBURBS = {
 }
 
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif"}
+MAX_DAYS_FILTER = 365
 
 app = Flask(__name__)
 app.secret_key = "supersecretkey"
+app.config["MAX_CONTENT_LENGTH"] = 10 * 1024 * 1024  # largest accepted upload
 
-DATABASE = "database/data_source.db"
+UPLOAD_DIR = os.path.join(app.root_path, "static", "uploads")
+STATIC_DIR = os.path.join(app.root_path, "static")
+
+DATABASE = os.environ.get("GRATIA_DATABASE", "database/data_source.db")
 
 TOKEN_TTL = 3600
 
 # ----------------- DB CONNECTION -----------------
+db_pool = database_manager.ConnectionPool(
+    DATABASE, factory=profiling.TimedConnection
+)
+
+
 def get_db():
     db = getattr(g, "_database", None)
     if db is None:
-        db = g._database = sqlite3.connect(DATABASE)
-        db.row_factory = sqlite3.Row
+        db = g._database = db_pool.acquire()
+        # Statements run for this request are timed (see INSTRUMENTATION)
+        db.recorder = g.get("query_recorder")
     return db
 
 
 @app.teardown_appcontext
 def close_connection(exception):
-    db = getattr(g, "_database", None)
+    db = g.pop("_database", None)
     if db:
-        db.close()
+        db.recorder = None
+        db_pool.release(db)
+
+
+# ----------------- INSTRUMENTATION -----------------
+# Every response gets a Server-Timing header with the time spent in SQL,
+# the number of statements and the total time; slow statements and likely
+# N+1 loops are logged to "gratia.sql" (thresholds in profiling.py).
+@app.before_request
+def start_request_timing():
+    g.query_recorder = profiling.QueryRecorder()
+    if profiling.profiling_enabled(request.endpoint):
+        g.profiler = profiling.start_profiler()
+
+
+@app.after_request
+def finish_request_timing(response):
+    recorder = g.pop("query_recorder", None)
+    if recorder is None:
+        return response
+    endpoint = request.endpoint or "unknown"
+    response.headers["Server-Timing"] = recorder.server_timing()
+    recorder.report(endpoint)
+    record_request_metrics(endpoint, response, recorder)
+    return response
+
+
+# after_request doesn't run when an exception propagates out of the request,
+# teardown always does, so the profiler is stopped and written here
+@app.teardown_request
+def finish_profiling(exception):
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        endpoint = request.endpoint or "unknown"
+        app.logger.info("profile written to %s", profiling.dump_profile(profiler, endpoint))
+
+
+# ----------------- METRICS -----------------
+# Prometheus text format at /metrics (see metrics.py for multi-worker setup).
+# Set GRATIA_METRICS_TOKEN to require "Authorization: Bearer <token>".
+metrics_registry = metrics.Registry()
+REQUEST_LATENCY = metrics_registry.histogram(
+    "gratia_request_duration_seconds",
+    "Time taken to build a response.",
+    ("endpoint", "method"),
+)
+REQUESTS = metrics_registry.counter(
+    "gratia_requests_total", "Responses sent.", ("endpoint", "method", "status")
+)
+REQUEST_SQL_TIME = metrics_registry.histogram(
+    "gratia_request_sql_seconds", "Time spent in SQLite per request.", ("endpoint",)
+)
+REQUEST_SQL_QUERIES = metrics_registry.histogram(
+    "gratia_request_sql_queries",
+    "SQL statements run per request.",
+    ("endpoint",),
+    buckets=(1, 2, 5, 10, 20, 50, 100),
+)
+POOL_CONNECTIONS = metrics_registry.gauge(
+    "gratia_db_pool_connections", "Pooled SQLite connections.", ("state",)
+)
+NOTIFICATION_STREAMS = metrics_registry.gauge(
+    "gratia_notification_streams", "Open notification event streams."
+)
+NOTIFICATIONS_CREATED = metrics_registry.counter(
+    "gratia_notifications_created_total", "Notifications stored and published."
+)
+UPLOAD_BYTES = metrics_registry.histogram(
+    "gratia_upload_bytes", "Size of uploaded images.", buckets=metrics.SIZE_BUCKETS
+)
+FRAGMENT_CACHE = metrics_registry.counter(
+    "gratia_fragment_cache_total", "Cached fragment lookups.", ("fragment", "result")
+)
+JOB_QUEUE_DEPTH = metrics_registry.gauge(
+    "gratia_job_queue_depth", "Jobs queued or running.", shared=False
+)
+METRICS_TOKEN = os.environ.get("GRATIA_METRICS_TOKEN")
+
+
+def record_request_metrics(endpoint, response, recorder):
+    elapsed = time.perf_counter() - recorder.started
+    REQUEST_LATENCY.observe(elapsed, endpoint, request.method)
+    REQUESTS.inc(endpoint, request.method, response.status_code)
+    REQUEST_SQL_TIME.observe(recorder.sql_seconds, endpoint)
+    REQUEST_SQL_QUERIES.observe(recorder.count, endpoint)
+    update_process_gauges()
+    metrics_registry.flush(force=False)
+
+
+def update_process_gauges():
+    POOL_CONNECTIONS.set(db_pool.in_use, "in_use")
+    POOL_CONNECTIONS.set(db_pool.idle_count(), "idle")
+    NOTIFICATION_STREAMS.set(notification_bus.subscriber_count())
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    if METRICS_TOKEN and not secrets.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}"
+    ):
+        return "", 401
+    update_process_gauges()
+    JOB_QUEUE_DEPTH.set(job_queue.depth())
+    return metrics_registry.render(), 200, {"Content-Type": metrics.CONTENT_TYPE}
+
+
+# ----------------- MIGRATIONS -----------------
+# Bring the schema (tables + indexes) up to date before serving anything
+database_manager.migrate(DATABASE)
+
+
+# ----------------- CLI COMMANDS -----------------
+@app.cli.command("migrate")
+def migrate_command():
+    ran = database_manager.migrate(DATABASE)
+    for version, name in ran:
+        click.echo(f"applied {version:04d}_{name}")
+    if not ran:
+        click.echo("schema is up to date")
+
+
+@app.cli.command("rebuild-search")
+def rebuild_search_command():
+    con = sqlite3.connect(DATABASE)
+    count = database_manager.rebuild_search_index(con)
+    con.close()
+    click.echo(f"indexed {count} donations")
+
+
+@app.cli.command("run-jobs")
+@click.option("--drain", is_flag=True, help="Run the jobs that are due now, then exit.")
+def run_jobs_command(drain):
+    if drain:
+        job_queue.drain()
+    else:
+        job_queue.work()
+
+
+@app.cli.command("image-variants")
+def image_variants_command():
+    # Queue variant generation for images uploaded before variants existed
+    db = db_pool.acquire()
+    rows = db.execute(
+        "SELECT DISTINCT image_url FROM Donations WHERE image_url IS NOT NULL AND image_variants IS NULL"
+    ).fetchall()
+    for row in rows:
+        job_queue.enqueue(db, "image_variants", {"image_url": row["image_url"]})
+    db.commit()
+    db_pool.release(db)
+    click.echo(f"queued {len(rows)} images, process them with 'flask --app main run-jobs'")
+
+
+@app.cli.command("build-assets")
+def build_assets_command():
+    manifest = assets.build_assets(STATIC_DIR)
+    STATIC_MANIFEST.clear()
+    STATIC_MANIFEST.update(manifest)
+    click.echo(f"fingerprinted {len(manifest)} files into static/{assets.DIST_DIR}/")
+
+
+@app.cli.command("backfill-dates")
+@click.option("--batch-size", default=500, show_default=True)
+def backfill_dates_command(batch_size):
+    con = sqlite3.connect(DATABASE)
+    converted, unparsed = database_manager.backfill_dates(con, batch_size)
+    con.close()
+    for table, count in converted.items():
+        click.echo(f"{table}: converted {count} dates")
+    for table, key, value in unparsed:
+        click.echo(f"{table} {key}: can't read date {value!r}", err=True)
+    if unparsed:
+        raise SystemExit(1)
+
+
+@app.cli.command("user-stats")
+@click.option("--rebuild", is_flag=True, help="Recount every user's statistics.")
+def user_stats_command(rebuild):
+    con = sqlite3.connect(DATABASE)
+    if rebuild:
+        count = database_manager.rebuild_user_stats(con)
+        con.close()
+        click.echo(f"rebuilt statistics for {count} users")
+        return
+    problems = database_manager.check_user_stats(con)
+    con.close()
+    for user_id, column, stored, actual in problems:
+        click.echo(f"{user_id} {column}: stored {stored}, actual {actual}", err=True)
+    if problems:
+        click.echo("run 'flask --app main user-stats --rebuild' to fix", err=True)
+        raise SystemExit(1)
+    click.echo("user statistics are consistent")
+
+
+@app.cli.command("check-plans")
+def check_plans_command():
+    con = sqlite3.connect(DATABASE)
+    problems = database_manager.check_query_plans(con)
+    con.close()
+    for name, detail in problems:
+        click.echo(f"{name}: {detail}", err=True)
+    if problems:
+        raise SystemExit(1)
+    click.echo("all hot queries use an index")
+
+
+# ----------------- JOB QUEUE -----------------
+# Worker threads for post-commit side effects (see job_queue.py).
+# GRATIA_JOB_WORKERS=0 leaves jobs queued until job_queue.drain() is called.
+job_queue = JobQueue(db_pool, workers=int(os.environ.get("GRATIA_JOB_WORKERS", "1")))
+
+
+@app.before_request
+def start_job_workers():
+    job_queue.start()
+
+
+def queue_job(kind, payload):
+    # Queued on the request's connection; the view commits it with its own
+    # writes and the workers are woken once the request is over
+    job_queue.enqueue(get_db(), kind, payload)
+    g.jobs_queued = True
+
+
+@app.teardown_request
+def wake_job_workers(exception):
+    if g.pop("jobs_queued", False):
+        job_queue.wake()
+
+
+# ----------------- STATIC ASSETS -----------------
+# After 'flask --app main build-assets', url_for("static", ...) points at the
+# fingerprinted copies in static/dist/. Their names change with their content,
+# so browsers may keep them for a year without revalidating.
+STATIC_MANIFEST = assets.load_manifest(STATIC_DIR)
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Precompressed files written by the build, in order of preference
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+
+@app.url_defaults
+def fingerprint_static_url(endpoint, values):
+    if endpoint == "static" and STATIC_MANIFEST:
+        filename = values.get("filename")
+        if filename in STATIC_MANIFEST:
+            values["filename"] = STATIC_MANIFEST[filename]
+
+
+@app.route("/static/dist/<path:filename>")
+def static_dist(filename):
+    dist_dir = os.path.join(STATIC_DIR, assets.DIST_DIR)
+    served = filename
+    encoding = None
+    for name, suffix in PRECOMPRESSED:
+        if name in request.accept_encodings and os.path.isfile(
+            os.path.join(dist_dir, filename + suffix)
+        ):
+            served, encoding = filename + suffix, name
+            break
+
+    response = send_from_directory(
+        dist_dir, served, max_age=IMMUTABLE_MAX_AGE, conditional=True
+    )
+    if encoding:
+        # Keep the type of the original file rather than application/gzip
+        response.mimetype = mimetypes.guess_type(filename)[0] or response.mimetype
+        response.content_encoding = encoding
+    response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@app.route("/serviceworker.js")
+def service_worker():
+    # Served from the root so its scope is the whole site; never cached by
+    # the browser so a new build is picked up on the next visit
+    path = assets.service_worker_path(STATIC_DIR)
+    response = send_from_directory(
+        os.path.dirname(path), os.path.basename(path), max_age=0
+    )
+    response.mimetype = "application/javascript"
+    response.cache_control.no_cache = True
+    return response
 
 
 # ----------------- UTIL / AUTH -----------------
@@ -105,15 +426,76 @@ def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def now_timestamp():
+    # Sortable local time, the format Donations/Users dates are stored in
+    return datetime.now().strftime(database_manager.TIMESTAMP_FORMAT)
+
+
+def days_filter():
+    # ?days=N limits a listing to the last N days; returns the cutoff or None
+    try:
+        days = int(request.args.get("days", ""))
+    except ValueError:
+        return None
+    if not 1 <= days <= MAX_DAYS_FILTER:
+        return None
+    cutoff = datetime.now() - timedelta(days=days)
+    return cutoff.strftime(database_manager.TIMESTAMP_FORMAT)
+
+
+@app.template_filter("datetime_display")
+def datetime_display(value, date_format="%d/%m/%y %H:%M"):
+    try:
+        return datetime.strptime(value, database_manager.TIMESTAMP_FORMAT).strftime(
+            date_format
+        )
+    except (TypeError, ValueError):
+        return value or ""
+
+
+# ----------------- USER CACHE -----------------
+# Recently seen Users rows, shared between requests in this process.
+# The TTL bounds how stale a row can get when another worker changed it.
+USER_CACHE_SIZE = 1024  # 0 turns the cross-request cache off
+USER_CACHE_TTL = 30  # seconds
+
+_user_cache = OrderedDict()
+_user_cache_lock = threading.Lock()
+
+
+def load_user_row(user_id):
+    now = time.monotonic()
+    with _user_cache_lock:
+        entry = _user_cache.get(user_id)
+        if entry and entry[0] > now:
+            _user_cache.move_to_end(user_id)
+            return entry[1]
+
+    row = get_db().execute(queries.USER_BY_ID, (user_id,)).fetchone()
+    if row and USER_CACHE_SIZE:
+        with _user_cache_lock:
+            _user_cache[user_id] = (now + USER_CACHE_TTL, row)
+            _user_cache.move_to_end(user_id)
+            while len(_user_cache) > USER_CACHE_SIZE:
+                _user_cache.popitem(last=False)
+    return row
+
+
+def invalidate_user(user_id):
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+
+
 def current_user():
-    if "user_id" in session:
-        db = get_db()
-        row = db.execute(
-            "SELECT * FROM Users WHERE user_id=?", (session["user_id"],)
-        ).fetchone()
-        if row:
-            return User(row)
-    return None
+    # Looked up once per request; views and the context processor share it
+    if "_current_user" not in g:
+        user = None
+        if "user_id" in session:
+            row = load_user_row(session["user_id"])
+            if row:
+                user = User(row)
+        g._current_user = user
+    return g._current_user
 
 
 def login_required(f):
@@ -145,13 +527,103 @@ def opp_login_required(f):
     return decorated_function
 
 
+# ----------------- CONDITIONAL GET -----------------
+# List pages and the notification feed answer 304 Not Modified while nothing
+# they show has changed. The ETag is built from the user's data version
+# (migration 0013), the versions of any shared tables the page lists, the
+# full path and RENDER_VERSION, so checking it costs one or two primary key
+# lookups and runs before any of the view's own queries.
+def templates_version():
+    # Pages must not stay "unchanged" across a deploy that changes templates
+    # or assets, so those are part of every ETag
+    digest = hashlib.sha1(json.dumps(STATIC_MANIFEST, sort_keys=True).encode())
+    for root, _, files in sorted(os.walk(os.path.join(app.root_path, app.template_folder))):
+        for name in sorted(files):
+            with open(os.path.join(root, name), "rb") as f:
+                digest.update(name.encode() + f.read())
+    return digest.hexdigest()[:16]
+
+
+RENDER_VERSION = templates_version()
+
+
+def page_etag(user, tables):
+    db = get_db()
+    state = [
+        RENDER_VERSION,
+        request.full_path,
+        "fragment" if swup_fragment() else "page",
+        user.user_id,
+        str(database_manager.user_data_version(db, user.user_id)),
+    ]
+    state += [f"{t}:{database_manager.data_version(db, t)}" for t in tables]
+    # a ?days= window slides with the clock, same hourly bucket as the
+    # donations catalogue fragment
+    since = days_filter()
+    if since:
+        state.append(since[:13])
+    return hashlib.sha1("|".join(state).encode()).hexdigest()
+
+
+def conditional_get(*tables):
+    # tables: shared tables (DataVersions names) the page shows beyond the
+    # user's own rows, e.g. the whole donations catalogue
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            user = current_user()
+            # A page carrying flashed messages is only right once
+            if request.method != "GET" or user is None or session.get("_flashes"):
+                return f(*args, **kwargs)
+            etag = page_etag(user, tables)
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = "private, no-cache"
+            response.vary.add("Cookie")
+            return response
+
+        return decorated_function
+
+    return decorator
+
+
+# ----------------- SWUP FRAGMENTS -----------------
+# Swup (static/js/swup-init.js) fetches pages with "X-Requested-With: swup"
+# and only swaps the #swup container and the title. Those requests render
+# templates/fragment.html instead of the full layout: no navbar, no
+# notification sidebar and none of the notification queries behind it.
+SWUP_HEADER = "X-Requested-With"
+
+
+def swup_fragment():
+    return request.headers.get(SWUP_HEADER) == "swup"
+
+
+@app.context_processor
+def inject_swup_fragment():
+    return dict(swup_fragment=swup_fragment())
+
+
+@app.after_request
+def vary_on_swup(response):
+    # One URL, two bodies: browser and service worker caches keep both
+    if response.mimetype == "text/html":
+        response.vary.add(SWUP_HEADER)
+    return response
+
+
 # ------------------- FORGOT PASSWORD -------------------
 @app.route("/forgot", methods=["GET", "POST"])
 def forgot_password():
     if request.method == "POST":
         email = request.form.get("email").strip().lower()
         db = get_db()
-        user = db.execute("SELECT * FROM Users WHERE email=?", (email,)).fetchone()
+        user = db.execute(queries.USER_BY_EMAIL, (email,)).fetchone()
 
         if user:
             # create secure random token
@@ -168,7 +640,7 @@ def forgot_password():
 
             reset_url = url_for("reset_password", token=raw_token, _external=True)
             # TODO: send this link via email (replace with real SMTP)
-            print("Password reset link:", reset_url)
+            app.logger.info("password reset link for %s: %s", user.user_id, reset_url)
 
         flash("If the account exists, we sent a reset link.", "info")
         return redirect(url_for("signin_page"))
@@ -182,10 +654,7 @@ def reset_password(token):
     token_hash = hashlib.sha256(token.encode()).hexdigest()
     now = int(time.time())
 
-    record = db.execute(
-        "SELECT * FROM PasswordResetTokens WHERE token_hash=? AND used=0 AND expires_at>?",
-        (token_hash, now),
-    ).fetchone()
+    record = db.execute(queries.RESET_TOKEN, (token_hash, now)).fetchone()
 
     if not record:
         flash("Invalid or expired link.", "error")
@@ -212,6 +681,7 @@ def reset_password(token):
         )
         db.execute("UPDATE PasswordResetTokens SET used=1 WHERE id=?", (record["id"],))
         db.commit()
+        invalidate_user(record["user_id"])
 
         flash("Password has been reset. You can now sign in.", "success")
         return redirect(url_for("signin_page"))
@@ -248,12 +718,12 @@ def signup_page():
 
         hashed = generate_password_hash(password)
         user_id = str(uuid.uuid4())
-        creation_date = datetime.now().strftime("%d/%m/%y %H:%M:%S")
+        creation_date = now_timestamp()
 
         db = get_db()
         try:
             db.execute(
-                "INSERT INTO Users (user_id, name, email, password, role, creation_date) VALUES (?, ?, ?, ?, ?), ?",
+                "INSERT INTO Users (user_id, name, email, password, role, creation_date) VALUES (?, ?, ?, ?, ?, ?)",
                 (user_id, name, email, hashed, role, creation_date),
             )
             db.commit()
@@ -306,7 +776,7 @@ def signin_page():
         password = request.form.get("password")
 
         db = get_db()
-        row = db.execute("SELECT * FROM Users WHERE email=?", (email,)).fetchone()
+        row = db.execute(queries.USER_BY_EMAIL, (email,)).fetchone()
         user = User(row) if row else None
 
         if user and check_password_hash(user.password, password):
@@ -323,40 +793,17 @@ def signin_page():
 # ----------------- MATCHES (list user's matches) -----------------
 @app.route("/matches")
 @login_required
+@conditional_get()
 def matches():
     db = get_db()
     user = current_user()
 
     if user.role == "Donor":
         # Donor: see matches for their donations
-        matches = db.execute(
-            """
-            SELECT m.match_id, m.donation_id, m.status, m.donor_completed, m.recipient_completed,
-                    d.items, d.category, d.image_url,
-                    u.name AS recipient_name, m.recipient_id, m.donor_completed, m.recipient_completed
-            FROM Matches m
-            JOIN Donations d ON m.donation_id = d.donation_id
-            JOIN Users u ON m.recipient_id = u.user_id
-            WHERE d.donor_id = ?
-            ORDER BY m.match_id DESC
-            """,
-            (user.user_id,),
-        ).fetchall()
+        matches = db.execute(queries.DONOR_MATCHES, (user.user_id,)).fetchall()
     else:
         # Recipient: see matches they requested
-        matches = db.execute(
-            """
-            SELECT m.match_id, m.donation_id, m.status, m.donor_completed, m.recipient_completed,
-                    d.items, d.category, d.image_url,
-                    u.name AS donor_name, m.donor_id
-            FROM Matches m
-            JOIN Donations d ON m.donation_id = d.donation_id
-            JOIN Users u ON d.donor_id = u.user_id
-            WHERE m.recipient_id = ?
-            ORDER BY m.match_id DESC
-            """,
-            (user.user_id,),
-        ).fetchall()
+        matches = db.execute(queries.RECIPIENT_MATCHES, (user.user_id,)).fetchall()
 
     return render_template("partials/matches.html", matches=matches, user=user)
 
@@ -364,6 +811,7 @@ def matches():
 # ----------------- FIND MATCHES (for recipients to find donations) -----------------
 @app.route("/find_matches", methods=["GET", "POST"])
 @login_required
+@conditional_get("Donations", "Matches")
 def find_matches():
     user = current_user()
     db = get_db()
@@ -375,33 +823,91 @@ def find_matches():
     if request.method == "POST":
         donation_id = request.form.get("donation_id")
         if donation_id:
-            db = get_db()
-            db.execute(
-                """
-                INSERT INTO Matches (donation_id, recipient_id, status, donor_completed, recipient_completed)
-                VALUES (?, ?, 'Pending', 0, 0)
-                """,
-                (donation_id, user.user_id)
-            )
-            db.commit()
-            flash("Request sent!", "success")
+            if submit_claim(db, user, donation_id) is None:
+                return redirect(url_for("find_matches"))
             return redirect(url_for("matches"))
 
-    # Show available donations
-    donations = db.execute(
-        """
-        SELECT d.*, u.name AS donor_name
-        FROM Donations d
-        JOIN Users u ON d.donor_id = u.user_id
-        WHERE d.donation_id NOT IN (
-            SELECT donation_id FROM Matches WHERE recipient_id = ?
+    conditions = list(queries.FIND_MATCHES["conditions"])
+    params = [user.user_id, user.user_id]
+    since = days_filter()
+    if since:
+        conditions.append(queries.FIND_MATCHES_SINCE)
+        params.append(since)
+
+    # ?km=N: nearest first within N km of the recipient's suburb
+    if request.args.get("km") and user.latitude is not None:
+        km = geo.radius_km(request.args.get("km"))
+        nearby = geo.nearby_donations(
+            db,
+            user.latitude,
+            user.longitude,
+            km,
+            page_limit(request.args.get("limit")),
+            recipient_id=user.user_id,
         )
-        ORDER BY d.date_donated DESC
-        """,
-        (user.user_id,),
-    ).fetchall()
+        page = Page(nearby, None, None)
+        return render_template(
+            "partials/find_matches.html", matches=page, page=page, user=user, km=km
+        )
+
+    # Show available donations this recipient hasn't asked for yet.
+    # AvailableDonations is maintained by triggers (see migration 0005), so
+    # this walks it in date order and anti-joins the recipient's own matches
+    # and places in line.
+    donations = keyset_page(
+        db,
+        **dict(queries.FIND_MATCHES, conditions=conditions),
+        params=params,
+        **page_args(),
+    )
 
-    return render_template("partials/find_matches.html", matches=donations, user=user)
+    return render_template(
+        "partials/find_matches.html", matches=donations, page=donations, user=user
+    )
+
+
+@app.route("/api/donations/nearby")
+@login_required
+def nearby_donations_api():
+    # ?lat=&lon= or the signed in user's suburb; ?km= radius, ?limit= results
+    user = current_user()
+    try:
+        lat = float(request.args["lat"])
+        lon = float(request.args["lon"])
+    except (KeyError, ValueError):
+        lat, lon = user.latitude, user.longitude
+    if lat is None or lon is None or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return jsonify({"error": "no location given and none saved in settings"}), 400
+
+    km = geo.radius_km(request.args.get("km"))
+    donations = geo.nearby_donations(
+        get_db(),
+        lat,
+        lon,
+        km,
+        page_limit(request.args.get("limit")),
+        recipient_id=user.user_id if user.role == "Recipient" else None,
+    )
+    return jsonify(
+        {
+            "km": km,
+            "donations": [
+                {
+                    "donation_id": d["donation_id"],
+                    "items": d["items"],
+                    "category": d["category"],
+                    "location": d["location"],
+                    "donor_name": d["donor_name"],
+                    "date_donated": d["date_donated"],
+                    "distance_km": d["distance_km"],
+                    "image_url": url_for("static", filename=d["image_url"])
+                    if d["image_url"]
+                    else None,
+                }
+                for d in donations
+            ],
+        }
+    )
 
 
 @app.route("/request_donation/<donation_id>", methods=["POST"])
@@ -412,36 +918,24 @@ def request_donation(donation_id):
         flash("Only recipients can request donations.", "error")
         return redirect(url_for("dashboard"))
 
-    donation = db.execute(
-        "SELECT * FROM Donations WHERE donation_id=?", (donation_id,)
-    ).fetchone()
-
-    db = get_db()
-    db.execute(
-        "UPDATE Donations SET status='Requested', recipient_id=? WHERE donation_id=?",
-        (user.user_id, donation_id),
-    )
-    db.commit()
-
-    create_notification(
-        donation["donor_id"], 
-        f"{user.name} requested your donation: {donation['items']}"
-    )
-
-    flash("Donation requested!", "success")
+    # Joins the donation's waiting list rather than taking it over from
+    # whoever asked first (see CLAIM)
+    submit_claim(get_db(), user, donation_id)
     return redirect(url_for("find_matches"))
 
 
 @app.route("/my_donations")
 @login_required
+@conditional_get()
 def my_donations():
     user = current_user()
     db = get_db()
-    donations = db.execute(
-        "SELECT d.*, u.name AS recipient_name FROM Donations d LEFT JOIN Users u ON d.recipient_id = u.user_id WHERE d.donor_id=?",
-        (user.user_id,),
-    ).fetchall()
-    return render_template("partials/my_donations.html", donations=donations, user=user)
+    donations = keyset_page(
+        db, **queries.MY_DONATIONS, params=[user.user_id], **page_args()
+    )
+    return render_template(
+        "partials/my_donations.html", donations=donations, page=donations, user=user
+    )
 
 
 @app.route("/mark_donated/<donation_id>", methods=["POST"])
@@ -449,20 +943,25 @@ def my_donations():
 def mark_donated(donation_id):
     user = current_user()
     db = get_db()
-    db.execute(
-        "UPDATE Donations SET status='Donated' WHERE donation_id=? AND donor_id=?",
-        (donation_id, user.user_id),
-    )
-    db.commit()    
-    donation = db.execute(
-        "SELECT * FROM Donations WHERE donation_id=?", (donation_id,)
-    ).fetchone()
-    
-    create_notification(
-        donation["recipient_id"], 
-        f"{user.name} marked your requested donation '{donation['items']}' as donated."
-    )
-    
+    with match_lifecycle.write_transaction(db):
+        # The waiting list is emptied along the way, so read it first
+        active = match_lifecycle.active_match(db, donation_id)
+        waiting = []
+        if active:
+            waiting = match_lifecycle.waiting_recipients(db, active["match_id"])
+        donation, rejected = match_lifecycle.mark_donated(db, donation_id, user.user_id)
+        if donation and donation["recipient_id"]:
+            create_notification(
+                donation["recipient_id"],
+                f"{user.name} marked your requested donation '{donation['items']}' as donated.",
+            )
+        turned_away = waiting + ([rejected] if rejected else [])
+        if donation and turned_away:
+            create_notifications(
+                turned_away, f"'{donation['items']}' has been donated to someone else."
+            )
+    leaderboard.invalidate(utc_today())
+
     flash("Donation marked as donated!", "success")
     return redirect(url_for("my_donations"))
 
@@ -481,28 +980,82 @@ def add():
     if request.method == "POST":
         items = request.form.get("items")
         category = request.form.get("category")
-        date_donated = datetime.now().strftime("%d/%m/%y %H:%M")
+        date_donated = now_timestamp()
+        # Picked up from the donor's own suburb unless another one is chosen
+        location, latitude, longitude = geo.parse_location(
+            request.form.get("location") or user.location
+        )
         image_file = request.files.get("image")
         image_filename = None
 
         if image_file and allowed_file(image_file.filename):
-            filename = secure_filename(image_file.filename)
-            image_path = os.path.join(current_app.root_path, "static/uploads", filename)
-            os.makedirs(os.path.dirname(image_path), exist_ok=True)
-            image_file.save(image_path)
+            extension = image_file.filename.rsplit(".", 1)[1].lower()
+            filename = uploads.save_upload(image_file, UPLOAD_DIR, extension)
+            UPLOAD_BYTES.observe(os.path.getsize(os.path.join(UPLOAD_DIR, filename)))
             image_filename = f"uploads/{filename}"
 
         db = get_db()
-        donation_id = str(uuid.uuid4())  # Generate unique donation_id
         db.execute(
-            "INSERT INTO Donations (donor_id, category, items, date_donated, image_url) VALUES (?, ?, ?, ?, ?)",
-            (user.user_id, category, items, date_donated, image_filename),
+            """
+            INSERT INTO Donations (donor_id, category, items, date_donated, image_url, location, latitude, longitude)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                user.user_id,
+                category,
+                items,
+                date_donated,
+                image_filename,
+                location,
+                latitude,
+                longitude,
+            ),
         )
+        notify_interested_recipients(user, category, items)
+        if image_filename:
+            # Thumbnails and WebP copies are made off the request thread
+            queue_job("image_variants", {"image_url": image_filename})
         db.commit()
         flash("Donation added!", "success")
         return redirect(url_for("dashboard"))
 
-    return render_template("partials/add.html", user=user)
+    return render_template("partials/add.html", user=user, suburbs=AU_SUBURBS)
+
+
+# ----------------- MATCHING (notify recipients who want this category) -----------------
+category_index = CategoryIndex()
+
+
+def notify_interested_recipients(donor, category, items):
+    recipients = category_index.interested(get_db(), category)
+    recipients.discard(donor.user_id)
+    if recipients:
+        create_notifications(recipients, f"New {category} donation available: {items}")
+
+
+# ----------------- IMAGES -----------------
+@job_queue.handler("image_variants")
+def image_variants_job(db, payload):
+    image_url = payload["image_url"]
+    variants = uploads.build_variants(UPLOAD_DIR, image_url.split("/", 1)[1])
+    if variants:
+        db.execute(
+            "UPDATE Donations SET image_variants=? WHERE image_url=?",
+            (
+                json.dumps({name: f"uploads/{file}" for name, file in variants.items()}),
+                image_url,
+            ),
+        )
+
+
+@app.template_global()
+def image_variants(item):
+    # {} until the job has run (or when Pillow isn't installed)
+    try:
+        variants = item["image_variants"]
+    except (IndexError, KeyError):
+        return {}
+    return json.loads(variants) if variants else {}
 
 
 # uhhhh
@@ -522,6 +1075,39 @@ def landing_page():
 
 
 # ----------------- CLAIM recipient requests a donation) -----------------
+# Claims and their later states go through match_lifecycle: one conditional
+# statement per transition inside a BEGIN IMMEDIATE transaction. When a
+# donation is already held, later claimants wait in line and the next one
+# moves up by itself if the donor rejects the current claim.
+def submit_claim(db, user, donation_id):
+    # Returns the place in line (0 = with the donor now) or None, and
+    # flashes what happened
+    with match_lifecycle.write_transaction(db):
+        place = match_lifecycle.claim(db, donation_id, user.user_id, now_timestamp())
+        if place == 0:
+            donation = db.execute(
+                "SELECT donor_id, items FROM Donations WHERE donation_id = ?",
+                (donation_id,),
+            ).fetchone()
+            create_notification(
+                donation["donor_id"],
+                f"{user.name} requested your donation: {donation['items']}",
+            )
+    if place is None:
+        flash(
+            "This donation is no longer available, or you have already asked for it.",
+            "warning",
+        )
+    elif place == 0:
+        flash("You have requested this donation.", "success")
+    else:
+        flash(
+            f"Someone asked first. You are number {place} on the waiting list.",
+            "info",
+        )
+    return place
+
+
 @app.route("/claim/<int:donation_id>", methods=["POST"])
 @login_required
 def claim_donation(donation_id):
@@ -532,30 +1118,8 @@ def claim_donation(donation_id):
         flash("Only recipients can claim donations.", "error")
         return redirect(url_for("dashboard"))
 
-    donation = db.execute(
-        "SELECT donor_id FROM Donations WHERE donation_id = ?", (donation_id,)
-    ).fetchone()
-    if not donation:
-        flash("Donation not found.", "error")
-        return redirect(url_for("dashboard"))
-
-    # Check existing in matches_ex (use matches_ex table)
-    existing = db.execute(
-        "SELECT * FROM matches_ex WHERE donation_id = ?",
-        (donation_id,),
-    ).fetchone()
-    if existing:
-        flash("This donation has already been requested/claimed.", "warning")
-        return redirect(url_for("home_page"))
-
-    # Insert into matches_ex
-    db.execute(
-        "INSERT INTO matches_ex (donation_id, recipient_id, donor_id, status, donor_completed, recipient_completed) VALUES (?, ?, ?, ?, ?, ?)",
-        (donation_id, user.user_id, donation["donor_id"], "Pending", 0, 0),
-    )
-    db.commit()
-
-    flash("You have requested this donation.", "success")
+    if submit_claim(db, user, donation_id) is None:
+        return redirect(url_for("donations_page"))
     return redirect(url_for("matches"))
 
 
@@ -567,12 +1131,37 @@ def update_match_status(match_id, status):
     user = current_user()
 
     # Only donor can accept/reject
-    if user.role != "Donor":
+    if user.role != "Donor" or status not in match_lifecycle.DONOR_RESPONSES:
         flash("Unauthorized action.", "error")
         return redirect(url_for("matches"))
 
-    db.execute("UPDATE Matches SET status = ? WHERE match_id = ?", (status, match_id))
-    db.commit()
+    with match_lifecycle.write_transaction(db):
+        # Accepting empties the waiting list (trigger), so read it first
+        waiting = []
+        if status == match_lifecycle.ACCEPTED:
+            waiting = match_lifecycle.waiting_recipients(db, match_id)
+        match = match_lifecycle.respond(db, match_id, user.user_id, status)
+        if match:
+            donation = db.execute(
+                "SELECT items FROM Donations WHERE donation_id = ?",
+                (match["donation_id"],),
+            ).fetchone()
+            if waiting:
+                create_notifications(
+                    waiting, f"'{donation['items']}' has gone to another recipient."
+                )
+            promoted = None
+            if status == match_lifecycle.REJECTED:
+                promoted = match_lifecycle.active_match(db, match["donation_id"])
+            if promoted:
+                create_notification(
+                    promoted["recipient_id"],
+                    f"You're next in line: your request for '{donation['items']}' "
+                    "is now with the donor.",
+                )
+    if not match:
+        flash("This request has already been answered.", "info")
+        return redirect(url_for("matches"))
     flash(f"Match {status.lower()}!", "success")
     return redirect(url_for("matches"))
 
@@ -584,37 +1173,12 @@ def complete_match(match_id):
     db = get_db()
     user = current_user()
 
-    match = db.execute(
-        "SELECT * FROM Matches WHERE match_id = ?", (match_id,)
-    ).fetchone()
-
+    with match_lifecycle.write_transaction(db):
+        match = match_lifecycle.complete(db, match_id, user.user_id, user.role)
     if not match:
-        flash("Match not found.", "error")
-        return redirect(url_for("matches"))
-
-    if user.role == "Donor" and not match["donor_completed"]:
-        db.execute(
-            "UPDATE Matches SET donor_completed = 1 WHERE match_id = ?", (match_id,)
-        )
-    elif user.role == "Recipient" and not match["recipient_completed"]:
-        db.execute(
-            "UPDATE Matches SET recipient_completed = 1 WHERE match_id = ?", (match_id,)
-        )
-    else:
         flash("Nothing to update.", "info")
         return redirect(url_for("matches"))
 
-    # If both completed, mark status as Completed
-    updated_match = db.execute(
-        "SELECT donor_completed, recipient_completed FROM Matches WHERE match_id = ?",
-        (match_id,),
-    ).fetchone()
-    if updated_match["donor_completed"] and updated_match["recipient_completed"]:
-        db.execute(
-            "UPDATE Matches SET status = 'Completed' WHERE match_id = ?", (match_id,)
-        )
-
-    db.commit()
     flash("Match updated!", "success")
     return redirect(url_for("matches"))
 
@@ -637,10 +1201,6 @@ def leave_review(donation_id):
         (donation_id, user.user_id),
     ).fetchone()
 
-    donationn = db.execute(
-        "SELECT * FROM Donations WHERE donation_id=?", (donation_id,)
-    ).fetchone()
-
     if not donation:
         flash("You cannot review this donation.", "error")
         return redirect(url_for("my_requests"))
@@ -649,12 +1209,11 @@ def leave_review(donation_id):
     db.execute(
         "UPDATE Donations SET review=? WHERE donation_id=?", (review_text, donation_id)
     )
-    db.commit()
-
     create_notification(
-        donationn["donor_id"],
+        donation["donor_id"],
         f"{user.name} left a review for donation: {donation['items']}",
     )
+    db.commit()
 
     flash("Review submitted! Thank you for your feedback.", "success")
     return redirect(url_for("my_requests"))
@@ -663,76 +1222,31 @@ def leave_review(donation_id):
 # ----------------- DASHBOARD -----------------
 @app.route("/dashboard")
 @login_required
+@conditional_get()
 def dashboard():
     db = get_db()
     user = current_user()
 
-    # Stats and recent activity
-    if user.role == "Donor":
-        # Count total donations
-        stats = db.execute(
-            """
-            SELECT 
-                COUNT(*) AS total_donations,
-                SUM(CASE WHEN status = 'Requested' THEN 1 ELSE 0 END) AS requested_donations,
-                SUM(CASE WHEN status = 'Completed' THEN 1 ELSE 0 END) AS Completed_donations
-            FROM Donations
-            WHERE donor_id = ?
-            """,
-            (user.user_id,),
-        ).fetchone()
+    # Counters kept up to date by triggers (see migration 0008_user_stats)
+    stats = db.execute(queries.USER_STATS, (user.user_id,)).fetchone() or dict.fromkeys(database_manager.USER_STATS_COLUMNS, 0)
 
+    # Recent activity
+    if user.role == "Donor":
         # Last 5 donations with status
-        recent = db.execute(
-            """
-            SELECT items, COALESCE(status, 'Available') AS status
-            FROM Donations
-            WHERE donor_id = ?
-            ORDER BY donation_id DESC
-            LIMIT 5
-            """,
-            (user.user_id,),
-        ).fetchall()
+        recent = db.execute(queries.DONOR_RECENT, (user.user_id,)).fetchall()
 
     else:  # Recipient
-        stats = db.execute(
-            """
-            SELECT 
-                COUNT(*) AS total_claims,
-                SUM(CASE WHEN status = 'Completed' THEN 1 ELSE 0 END) AS completed_claims,
-                SUM(CASE WHEN status = 'Pending' THEN 1 ELSE 0 END) AS pending_claims
-            FROM Donations
-            WHERE claimed_by = ?
-            """,
-            (user.user_id,),
-        ).fetchone()
-
         # Last 5 requests
-        recent = db.execute(
-            """
-            SELECT items, status
-            FROM Donations
-            WHERE claimed_by = ?
-            ORDER BY donation_id DESC
-            LIMIT 5
-            """,
-            (user.user_id,),
-        ).fetchall()
+        recent = db.execute(queries.RECIPIENT_RECENT, (user.user_id,)).fetchall()
 
     # Account creation date
-    creation_str = ""
-    try:
-        dt = datetime.strptime(user.creation_date.strip(), "%d/%m/%y %H:%M:%S")
-        creation_str = dt.strftime("%d %B %Y")
-    except Exception:
-        creation_str = user.creation_date if hasattr(user, "creation_date") else ""
+    creation_str = datetime_display(user.creation_date, "%d %B %Y")
 
     # Average rating
-    avg_row = db.execute(
-        "SELECT AVG(rating) AS avg FROM Ratings WHERE rated_id=?", (user.user_id,)
-    ).fetchone()
     avg_rating = (
-        round(avg_row["avg"], 1) if avg_row and avg_row["avg"] is not None else 0
+        round(stats["rating_sum"] / stats["rating_count"], 1)
+        if stats["rating_count"]
+        else 0
     )
 
     return render_template(
@@ -746,49 +1260,90 @@ def dashboard():
 
 
 # ----------------- DONATION PAGE -----------------
-@app.route("/donations")
-@login_required
-def donations_page():
-    db = get_db()
-    user = current_user()
+# The catalogue part of the page only changes when Donations does, so it is
+# rendered once per (filters, cursor, role, Donations version) and cached.
+fragment_cache = FragmentCache()
 
-    search = request.args.get("q", "")
-    category = request.args.get("category", "")
 
-    query = "SELECT * FROM Donations"
-    conditions = []
-    params = []
+def search_match_expression(text):
+    # Every word the user typed must appear, as a word or word prefix.
+    # Words are quoted so FTS5 operators in the input are treated as text.
+    words = re.findall(r"\w+", text)
+    return " ".join(f'"{word}"*' for word in words)
 
-    # 🔍 Apply search
-    if search:
-        conditions.append("(items LIKE ? OR category LIKE ?)")
-        params.extend([f"%{search}%", f"%{search}%"])
+
+def render_donation_catalogue(db, user, search, category, since):
+    match = search_match_expression(search)
+
+    # 🔍 Apply search (full-text index, best matches first)
+    if match:
+        listing = queries.CATALOGUE_SEARCH
+        params = [match]
+    else:
+        listing = queries.CATALOGUE
+        params = []
+    conditions = list(listing["conditions"])
 
     # 📂 Apply category filter
     if category:
-        conditions.append("category = ?")
+        conditions.append(queries.CATALOGUE_CATEGORY)
         params.append(category)
 
-    if conditions:
-        query += " WHERE " + " AND ".join(conditions)
+    # Only recent donations (range on the date index)
+    if since:
+        conditions.append(queries.CATALOGUE_SINCE)
+        params.append(since)
 
-    query += " ORDER BY donation_id DESC"
-
-    donations = db.execute(query, tuple(params)).fetchall()
+    donations = keyset_page(
+        db, **dict(listing, conditions=conditions), params=params, **page_args()
+    )
 
     # get distinct categories for dropdown
     categories = db.execute("SELECT DISTINCT category FROM Donations").fetchall()
 
     return render_template(
-        "donations.html",
+        "partials/donation_catalogue.html",
         user=user,
         donations=donations,
+        page=donations,
         search=search,
         category=category,
+        days=request.args.get("days", ""),
         categories=[c["category"] for c in categories],
     )
 
 
+@app.route("/donations")
+@login_required
+@conditional_get("Donations")
+def donations_page():
+    db = get_db()
+    user = current_user()
+
+    search = request.args.get("q", "")
+    category = request.args.get("category", "")
+    since = days_filter()
+
+    # Read the version before the rows: a write landing in between only makes
+    # the cached copy newer than its version, never older
+    version = database_manager.data_version(db, "Donations")
+    key = (
+        "donations",
+        version,
+        user.role,
+        # every argument ends up in the form or the pager links
+        tuple(sorted(request.args.items(multi=True))),
+        # a ?days= window slides with the clock, keep it for an hour at most
+        since[:13] if since else None,
+    )
+    catalogue, hit = fragment_cache.get_or_render(
+        key, lambda: render_donation_catalogue(db, user, search, category, since)
+    )
+    FRAGMENT_CACHE.inc("donations", "hit" if hit else "miss")
+
+    return render_template("donations.html", user=user, catalogue=Markup(catalogue))
+
+
 # ----------------- Settings ------------------
 @app.route("/settings")
 @login_required
@@ -797,12 +1352,14 @@ def settings():
     db= get_db()
     saved_categories = []
     if user.role == "Recipient":
-        rows = db.execute(
-            "SELECT category FROM Preferences WHERE user_id = ?",
-            (user.user_id,),
-        ).fetchall()
+        rows = db.execute(queries.PREFERENCES, (user.user_id,)).fetchall()
         saved_categories = [row["category"] for row in rows]
-    return render_template("partials/settings.html", user=user, saved_categories=saved_categories)
+    return render_template(
+        "partials/settings.html",
+        user=user,
+        saved_categories=saved_categories,
+        suburbs=AU_SUBURBS,
+    )
 
 
 @app.route("/update_profile", methods=["POST"])
@@ -854,6 +1411,14 @@ def update_preferences():
 
     db = get_db()
 
+    location, latitude, longitude = geo.parse_location(request.form.get("location"))
+    db.execute(
+        "UPDATE Users SET location=?, latitude=?, longitude=? WHERE user_id=?",
+        (location, latitude, longitude, user.user_id),
+    )
+    db.commit()
+    invalidate_user(user.user_id)
+
     # Only apply category preferences for Recipients
     if user.role == "Recipient":
         selected_categories = request.form.getlist("categories")
@@ -869,6 +1434,7 @@ def update_preferences():
             )
 
         db.commit()
+        category_index.set_user_categories(user.user_id, selected_categories)
 
     flash("Preferences updated!", "success")
     return redirect(url_for("settings"))
@@ -880,58 +1446,207 @@ def delete_account():
     # Optional: log them out first
     session.clear()
     user.delete()  # remove from DB
+    category_index.remove_user(user.user_id)
     flash("Your account has been deleted.", "success")
     return redirect(url_for("landing_page"))
 
 
 # ----------------- Notification ------------------
+NOTIFICATION_PAGE_SIZE = 20
+NOTIFICATION_MAX_PAGE_SIZE = 100
+# The badge only needs "is there anything unread", so stop counting early
+NOTIFICATION_UNREAD_CAP = 99
+
+
+def notification_page(user_id, limit=NOTIFICATION_PAGE_SIZE, before=None):
+    # Newest first; `before` is the id of the last notification already shown
+    db = get_db()
+    query = queries.NOTIFICATION_FEED
+    params = [user_id]
+    if before:
+        cursor = db.execute(queries.NOTIFICATION_CURSOR, (before, user_id)).fetchone()
+        if cursor:
+            query = queries.NOTIFICATION_FEED_OLDER
+            params.extend([cursor["created_at"], cursor["id"]])
+    # Fetch one extra row to know whether there is an older page
+    params.append(limit + 1)
+    rows = db.execute(query, tuple(params)).fetchall()
+    next_before = rows[limit - 1]["id"] if len(rows) > limit else None
+    return rows[:limit], next_before
+
+
+def unread_notification_count(user_id):
+    row = get_db().execute(
+        queries.UNREAD_NOTIFICATIONS, (user_id, NOTIFICATION_UNREAD_CAP)
+    ).fetchone()
+    return row["unread"]
+
+
 @app.context_processor
 def inject_notifications():
     user = current_user()
     notifications = []
     unread_count = 0
-    if user:
-        db = get_db()
-        notifications = db.execute(
-            "SELECT * FROM Notifications WHERE user_id=? ORDER BY created_at DESC",
-            (user.user_id,),
-        ).fetchall()
-        unread_count = sum(1 for n in notifications if n["read"] == 0)
-    return dict(notifications=notifications, notif_count=unread_count)
+    notif_next = None
+    # Only the sidebar of the full layout shows them
+    if user and not swup_fragment():
+        notifications, notif_next = notification_page(user.user_id)
+        unread_count = unread_notification_count(user.user_id)
+    return dict(
+        notifications=notifications, notif_count=unread_count, notif_next=notif_next
+    )
+
+
+def notification_json(n):
+    return {
+        "id": n["id"],
+        "message": n["message"],
+        "created_at": n["created_at"],
+        "read": n["read"],
+    }
 
 
 @app.route("/notifications")
+@conditional_get()
 def get_notifications():
+    # Pollers send back the ETag they have and get a 304 until a
+    # notification arrives or is read (see CONDITIONAL GET)
     user = current_user()
     if not user:
         return jsonify([]), 403
+
+    limit = request.args.get("limit", NOTIFICATION_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, NOTIFICATION_MAX_PAGE_SIZE))
+    before = request.args.get("before")
+
+    notifications, next_before = notification_page(user.user_id, limit, before)
+    return jsonify(
+        {
+            "notifications": [notification_json(n) for n in notifications],
+            "unread": unread_notification_count(user.user_id),
+            "next_before": next_before,
+        }
+    )
+
+
+# ----------------- Notification stream (SSE) ------------------
+notification_bus = NotificationBus()
+
+NOTIFICATION_HEARTBEAT = 15  # seconds between keep-alive comments
+# Streams are closed after a while so threads get recycled; the browser
+# reconnects by itself and resumes from Last-Event-ID
+NOTIFICATION_STREAM_MAX_AGE = 300
+NOTIFICATION_STREAM_RETRY = 5000  # ms the browser waits before reconnecting
+
+
+def notifications_after(user_id, last_id):
+    # Everything newer than the last event the client saw, oldest first
     db = get_db()
-    notifications = db.execute(
-        "SELECT id, message, created_at, read FROM Notifications WHERE user_id=? ORDER BY created_at DESC",
-        (user.user_id,),
+    cursor = db.execute(queries.NOTIFICATION_CURSOR, (last_id, user_id)).fetchone()
+    if not cursor:
+        return []
+    return db.execute(
+        queries.NOTIFICATIONS_AFTER,
+        (user_id, cursor["created_at"], cursor["id"], NOTIFICATION_MAX_PAGE_SIZE),
     ).fetchall()
 
-    return jsonify(
-        [
-            {
-                "id": n["id"],
-                "message": n["message"],
-                "created_at": n["created_at"],
-                "read": n["read"],
-            }
-            for n in notifications
-        ]
+
+def sse_event(notification):
+    return f"id: {notification['id']}\ndata: {json.dumps(notification)}\n\n"
+
+
+@app.route("/notifications/stream")
+def notification_stream():
+    user = current_user()
+    if not user:
+        return "", 403
+
+    # Subscribe before reading the backlog so nothing published in between is
+    # lost; the client ignores ids it already has
+    sub = notification_bus.subscribe(user.user_id)
+    try:
+        last_id = request.headers.get("Last-Event-ID") or request.args.get("last_id")
+        backlog = (
+            [notification_json(n) for n in notifications_after(user.user_id, last_id)]
+            if last_id
+            else []
+        )
+    except BaseException:
+        notification_bus.unsubscribe(sub)
+        raise
+
+    # The generator never touches the database, so the pooled connection goes
+    # back as soon as this view returns instead of living as long as the stream
+    def stream():
+        try:
+            yield f"retry: {NOTIFICATION_STREAM_RETRY}\n\n"
+            for notification in backlog:
+                yield sse_event(notification)
+            deadline = time.monotonic() + NOTIFICATION_STREAM_MAX_AGE
+            while time.monotonic() < deadline and not sub.overflowed:
+                try:
+                    notification = sub.get(timeout=NOTIFICATION_HEARTBEAT)
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield sse_event(notification)
+        finally:
+            notification_bus.unsubscribe(sub)
+
+    response = current_app.response_class(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
+    # A stream that is never started (HEAD, or the client left before the
+    # first chunk) never runs the generator's finally
+    response.call_on_close(lambda: notification_bus.unsubscribe(sub))
+    return response
 
 
+# Notifications are written by the job queue; callers commit the job together
+# with their own change, so the request itself only pays for one commit.
 def create_notification(user_id, message):
-    db = get_db()
-    notif_id = str(uuid.uuid4())
-    db.execute(
+    create_notifications([user_id], message)
+
+
+def create_notifications(user_ids, message):
+    queue_job(
+        "notify",
+        {
+            "user_ids": list(user_ids),
+            "message": message,
+            "created_at": datetime.now().isoformat(),
+        },
+    )
+
+
+@job_queue.handler("notify")
+def notify_job(db, payload):
+    # Same message to many users: one multi-row insert, committed with the batch
+    notifications = [
+        (
+            user_id,
+            {
+                "id": str(uuid.uuid4()),
+                "message": payload["message"],
+                "created_at": payload["created_at"],
+                "read": 0,
+            },
+        )
+        for user_id in payload["user_ids"]
+    ]
+    db.executemany(
         "INSERT INTO Notifications (id, user_id, message, created_at) VALUES (?, ?, ?, ?)",
-        (notif_id, user_id, message, datetime.now().isoformat()),
+        [(n["id"], user_id, n["message"], n["created_at"]) for user_id, n in notifications],
     )
-    db.commit()
+
+    def publish():
+        NOTIFICATIONS_CREATED.inc(amount=len(notifications))
+        for user_id, notification in notifications:
+            notification_bus.publish(user_id, notification)
+
+    return publish
 
 
 @app.route("/notifications/mark_read", methods=["POST"])
@@ -940,13 +1655,16 @@ def mark_notifications_read():
     if not user:
         return "", 403
     db = get_db()
-    db.execute("UPDATE Notifications SET read=1 WHERE user_id=?", (user.user_id,))
+    db.execute(
+        "UPDATE Notifications SET read=1 WHERE user_id=? AND read=0", (user.user_id,)
+    )
     db.commit()
     return "", 204
 
 
 @app.route("/my_requests")
 @login_required
+@conditional_get()
 def my_requests():
     user = current_user()
     db = get_db()
@@ -955,18 +1673,84 @@ def my_requests():
         flash("Only recipients can view their requests.", "error")
         return redirect(url_for("dashboard"))
 
-    requests = db.execute(
-        """
-        SELECT d.*, u.name AS donor_name
-        FROM Donations d
-        LEFT JOIN Users u ON d.donor_id = u.user_id
-        WHERE d.recipient_id = ?
-        ORDER BY d.donation_id DESC
-        """,
-        (user.user_id,),
-    ).fetchall()
+    requests = keyset_page(
+        db, **queries.MY_REQUESTS, params=[user.user_id], **page_args()
+    )
+
+    return render_template(
+        "partials/my_requests.html",
+        requests=requests,
+        page=requests,
+        queued=match_lifecycle.queued_claims(db, user.user_id),
+        user=user,
+    )
+
+
+@app.route("/leave_queue/<int:donation_id>", methods=["POST"])
+@login_required
+def leave_queue(donation_id):
+    db = get_db()
+    user = current_user()
+
+    with match_lifecycle.write_transaction(db):
+        left = match_lifecycle.leave_queue(db, donation_id, user.user_id)
+    if left:
+        flash("You have left the waiting list.", "success")
+    else:
+        flash("You are not on the waiting list for this donation.", "info")
+    return redirect(url_for("my_requests"))
+
+
+# ----------------- LEADERBOARD ------------------
+# Points and rankings come from the DonorDailyPoints rollup (see leaderboard.py)
+leaderboard = Leaderboard()
+
+
+def utc_today():
+    # Same day boundary as date('now') in the rollup triggers
+    return datetime.now(timezone.utc).date()
+
+
+@app.route("/leaderboard")
+def leaderboard_page():
+    period = request.args.get("period", "weekly")
+    if period not in PERIODS:
+        period = "weekly"
+    donors = leaderboard.top(get_db(), period, utc_today())
+    return render_template(
+        "partials/leaderboard.html",
+        donors=donors,
+        period=period,
+        periods=PERIODS,
+        user=current_user(),
+    )
+
+
+@app.route("/points")
+@login_required
+def points_page():
+    user = current_user()
+    points = user_points(get_db(), user.user_id, utc_today())
+    return render_template("partials/points.html", points=points, user=user)
+
+
+# ----------------- Pagination ------------------
+def page_args():
+    return dict(
+        after=request.args.get("after"),
+        before=request.args.get("before"),
+        limit=page_limit(request.args.get("limit")),
+    )
+
 
-    return render_template("partials/my_requests.html", requests=requests, user=user)
+@app.template_global()
+def page_url(**cursor):
+    # Same page with the same filters, moved to another cursor
+    args = request.args.to_dict()
+    args.pop("after", None)
+    args.pop("before", None)
+    args.update({key: value for key, value in cursor.items() if value})
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
 
 
 # ----------------- run -----------------
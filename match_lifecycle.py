@@ -0,0 +1,197 @@
+from contextlib import contextmanager
+
+import queries
+
+# A match is one recipient's claim on one donation:
+#
+#   Pending --accept--> Accepted --both sides complete--> Completed
+#      \--reject--> Rejected
+#
+# Every transition is a single conditional UPDATE (or INSERT) that only
+# matches rows in the state it starts from and returns the changed row, so
+# two requests racing for the same match or donation cannot both succeed and
+# nothing has to be read first. A donation has at most one active (Pending or
+# Accepted) match, enforced by a unique index, and the allowed status changes
+# are enforced by a trigger (migration 0014). Further claimants wait in
+# ClaimQueue and move up when the active claim is rejected (migration 0015).
+# Transitions return the changed row, or None when they did not apply.
+PENDING = "Pending"
+ACCEPTED = "Accepted"
+REJECTED = "Rejected"
+COMPLETED = "Completed"
+ACTIVE = (PENDING, ACCEPTED)
+TRANSITIONS = {
+    PENDING: (ACCEPTED, REJECTED),
+    ACCEPTED: (COMPLETED,),
+}
+DONOR_RESPONSES = TRANSITIONS[PENDING]
+
+@contextmanager
+def write_transaction(db):
+    # BEGIN IMMEDIATE takes the write lock before anything is read, so
+    # concurrent claims wait their turn (busy timeout) instead of failing to
+    # upgrade a read lock with "database is locked". Inside a transaction the
+    # request already opened, the statements simply join it.
+    if db.in_transaction:
+        yield db
+        return
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        yield db
+    except BaseException:
+        db.rollback()
+        raise
+    db.commit()
+
+
+def claim(db, donation_id, recipient_id, queued_at):
+    # One INSERT per claimant: everyone joins the donation's ClaimQueue and a
+    # trigger (migration 0015) makes the head of the queue the Pending match
+    # whenever nobody holds the donation. Only donations still on
+    # AvailableDonations (migration 0005) can be claimed, and only once per
+    # recipient, including claims the donor already turned down.
+    # Returns the place in line: 0 when the claim went straight to the donor,
+    # N when N claims (this one included) are waiting, None when it failed.
+    row = db.execute(
+        """
+        INSERT INTO ClaimQueue (donation_id, position, recipient_id, queued_at)
+        SELECT a.donation_id,
+            COALESCE(
+                (SELECT MAX(position) FROM ClaimQueue WHERE donation_id = a.donation_id), 0
+            ) + 1,
+            ?, ?
+        FROM AvailableDonations a
+        WHERE a.donation_id = ? AND a.donor_id IS NOT ?
+            AND NOT EXISTS (
+                SELECT 1 FROM Matches m
+                WHERE m.donation_id = a.donation_id AND m.recipient_id = ?
+            )
+        ON CONFLICT DO NOTHING
+        RETURNING donation_id, position
+        """,
+        (recipient_id, queued_at, donation_id, recipient_id, recipient_id),
+    ).fetchone()
+    if row is None:
+        return None
+    # Promoted claims have left the queue, and the queue is only non-empty
+    # while someone holds the donation, so nobody is ahead of those
+    return place_in_line(db, row["donation_id"], row["position"])
+
+
+def place_in_line(db, donation_id, position):
+    return db.execute(queries.PLACE_IN_LINE, (donation_id, position)).fetchone()[0]
+
+
+def queued_claims(db, recipient_id):
+    # The recipient's claims still waiting in line, with their place in it
+    return db.execute(queries.QUEUED_CLAIMS, (recipient_id,)).fetchall()
+
+
+def leave_queue(db, donation_id, recipient_id):
+    # Everyone behind moves up a place; positions are only compared
+    return db.execute(
+        """
+        DELETE FROM ClaimQueue WHERE donation_id = ? AND recipient_id = ?
+        RETURNING donation_id
+        """,
+        (donation_id, recipient_id),
+    ).fetchone()
+
+
+def waiting_recipients(db, match_id):
+    # Everyone queued behind the match's donation, first in line first
+    return [
+        row[0]
+        for row in db.execute(
+            """
+            SELECT q.recipient_id
+            FROM Matches m
+            JOIN ClaimQueue q ON q.donation_id = m.donation_id
+            WHERE m.match_id = ?
+            ORDER BY q.position
+            """,
+            (match_id,),
+        )
+    ]
+
+
+def active_match(db, donation_id):
+    # The Pending or Accepted match holding the donation, if any
+    return db.execute(
+        """
+        SELECT match_id, donation_id, recipient_id, status FROM Matches
+        WHERE donation_id = ? AND status IN ('Pending', 'Accepted')
+        """,
+        (donation_id,),
+    ).fetchone()
+
+
+def respond(db, match_id, donor_id, status):
+    # The donor accepts or rejects a pending claim on one of their donations.
+    # Only a donation that is still available can be accepted.
+    if status not in DONOR_RESPONSES:
+        return None
+    return db.execute(queries.MATCH_RESPOND, (status, match_id, donor_id, status)).fetchone()
+
+
+def mark_donated(db, donation_id, donor_id):
+    # The donor gave the donation away. Taking it off the market empties its
+    # ClaimQueue (trigger), then the pending claim, if any, is rejected so it
+    # can no longer be accepted. Returns the donation and the recipient whose
+    # claim was rejected (or None); the donation is None if it isn't theirs.
+    donation = db.execute(
+        """
+        UPDATE Donations SET status = 'Donated'
+        WHERE donation_id = ? AND donor_id = ?
+        RETURNING donation_id, items, recipient_id
+        """,
+        (donation_id, donor_id),
+    ).fetchone()
+    if donation is None:
+        return None, None
+    rejected = db.execute(
+        """
+        UPDATE Matches SET status = 'Rejected'
+        WHERE donation_id = ? AND status = 'Pending'
+        RETURNING recipient_id
+        """,
+        (donation_id,),
+    ).fetchone()
+    return donation, rejected["recipient_id"] if rejected else None
+
+
+def complete(db, match_id, user_id, role):
+    # Marks the caller's side of an accepted match as done; the match becomes
+    # Completed once both sides have. SET expressions see the row as it was,
+    # hence the repeated "OR ?".
+    donor, recipient = int(role == "Donor"), int(role == "Recipient")
+    return db.execute(
+        """
+        UPDATE Matches SET
+            donor_completed = donor_completed OR ?,
+            recipient_completed = recipient_completed OR ?,
+            status = CASE
+                WHEN (donor_completed OR ?) AND (recipient_completed OR ?)
+                THEN 'Completed' ELSE status
+            END
+        WHERE match_id = ? AND status = 'Accepted'
+            AND (
+                (? AND NOT donor_completed AND donation_id IN (
+                    SELECT donation_id FROM Donations WHERE donor_id = ?
+                ))
+                OR (? AND NOT recipient_completed AND recipient_id = ?)
+            )
+        RETURNING match_id, donation_id, recipient_id, status
+        """,
+        (
+            donor,
+            recipient,
+            donor,
+            recipient,
+            match_id,
+            donor,
+            user_id,
+            recipient,
+            user_id,
+        ),
+    ).fetchone()
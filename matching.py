@@ -0,0 +1,58 @@
+import threading
+import time
+
+
+# Inverted index category -> recipients who asked for that category, built
+# from the Preferences table. A new donation only has to look up its own
+# category instead of checking every user's preferences.
+#
+# Each worker process keeps its own copy. Changes made through this process
+# are applied straight away; changes made by other workers show up at the
+# next periodic reload.
+REFRESH_INTERVAL = 60  # seconds
+
+
+class CategoryIndex:
+    def __init__(self, refresh_interval=REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._users = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def load(self, db):
+        rows = db.execute(
+            """
+            SELECT p.user_id, p.category
+            FROM Preferences p
+            JOIN Users u ON u.user_id = p.user_id
+            WHERE u.role = 'Recipient' AND p.category IS NOT NULL
+            """
+        ).fetchall()
+        users = {}
+        for row in rows:
+            users.setdefault(row["category"], set()).add(row["user_id"])
+        with self._lock:
+            self._users = users
+            self._loaded_at = time.monotonic()
+
+    def _ensure_fresh(self, db):
+        if (
+            self._loaded_at is None
+            or time.monotonic() - self._loaded_at > self.refresh_interval
+        ):
+            self.load(db)
+
+    def interested(self, db, category):
+        self._ensure_fresh(db)
+        with self._lock:
+            return set(self._users.get(category, ()))
+
+    def set_user_categories(self, user_id, categories):
+        with self._lock:
+            for users in self._users.values():
+                users.discard(user_id)
+            for category in categories:
+                self._users.setdefault(category, set()).add(user_id)
+
+    def remove_user(self, user_id):
+        self.set_user_categories(user_id, ())
@@ -0,0 +1,226 @@
+import atexit
+import json
+import math
+import os
+import threading
+import time
+
+# Minimal Prometheus metrics. Values live in plain dicts in each process,
+# guarded by one lock, so recording costs a dict update.
+#
+# With several worker processes (gunicorn), set GRATIA_METRICS_DIR to a
+# directory shared by the workers and emptied when the server starts. Each
+# worker then writes a snapshot of its values to <dir>/<pid>.json at most
+# once every FLUSH_INTERVAL seconds, and /metrics adds up the snapshots of
+# all workers. Counters and histograms of workers that have exited are kept;
+# their gauges are dropped.
+METRICS_DIR = os.environ.get("GRATIA_METRICS_DIR")
+FLUSH_INTERVAL = 1.0  # seconds
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 1.5, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (10e3, 50e3, 100e3, 500e3, 1e6, 2.5e6, 5e6, 10e6)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, help_text, labels):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values = {}  # label values tuple -> value
+
+    def _key(self, label_values):
+        if len(label_values) != len(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}")
+        return tuple(str(value) for value in label_values)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *label_values, amount=1):
+        key = self._key(label_values)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, registry, name, help_text, labels, shared=True):
+        super().__init__(registry, name, help_text, labels)
+        # shared=False: the value is the same in every process (e.g. read
+        # from the database), so it is reported as is instead of summed
+        self.shared = shared
+
+    def set(self, value, *label_values):
+        key = self._key(label_values)
+        with self.registry.lock:
+            self.values[key] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name, help_text, labels, buckets):
+        super().__init__(registry, name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *label_values):
+        key = self._key(label_values)
+        with self.registry.lock:
+            # [count per bucket..., +Inf count, sum]; buckets are cumulated
+            # only when rendering
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += value
+
+
+class Registry:
+    def __init__(self, directory=METRICS_DIR):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self._flushed_at = 0.0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            atexit.register(self.flush)
+
+    def _add(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._add(Counter(self, name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=(), shared=True):
+        return self._add(Gauge(self, name, help_text, labels, shared))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(self, name, help_text, labels, buckets))
+
+    # ---- multiprocess ----
+    def snapshot(self, shared_only=False):
+        with self.lock:
+            return {
+                name: [
+                    [list(key), list(value) if isinstance(value, list) else value]
+                    for key, value in metric.values.items()
+                ]
+                for name, metric in self.metrics.items()
+                if not shared_only or getattr(metric, "shared", True)
+            }
+
+    def flush(self, force=True):
+        if not self.directory:
+            return
+        now = time.monotonic()
+        if not force and now - self._flushed_at < FLUSH_INTERVAL:
+            return
+        self._flushed_at = now
+        pid = os.getpid()
+        path = os.path.join(self.directory, f"{pid}.json")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"pid": pid, "metrics": self.snapshot(shared_only=True)}, f)
+        os.replace(tmp_path, path)
+
+    def _snapshots(self):
+        if not self.directory:
+            yield True, self.snapshot()
+            return
+        self.flush()
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue  # being replaced right now, or not ours
+            yield process_alive(data["pid"]), data["metrics"]
+
+    def collect(self):
+        # {name: {label values tuple: value}} summed over every process
+        merged = {name: {} for name in self.metrics}
+        for alive, metrics in self._snapshots():
+            for name, samples in metrics.items():
+                metric = self.metrics.get(name)
+                if metric is None or (metric.kind == "gauge" and not alive):
+                    continue
+                for key, value in samples:
+                    key = tuple(key)
+                    current = merged[name].get(key)
+                    if current is None:
+                        merged[name][key] = value
+                    elif isinstance(value, list):
+                        merged[name][key] = [a + b for a, b in zip(current, value)]
+                    else:
+                        merged[name][key] = current + value
+        if self.directory:
+            with self.lock:
+                for name, metric in self.metrics.items():
+                    if not getattr(metric, "shared", True):
+                        merged[name] = dict(metric.values)
+        return merged
+
+    def render(self):
+        lines = []
+        for name, samples in self.collect().items():
+            metric = self.metrics[name]
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key, value in sorted(samples.items()):
+                labels = dict(zip(metric.labels, key))
+                if metric.kind != "histogram":
+                    lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (math.inf,), value[:-1]):
+                    cumulative += count
+                    bucket_labels = dict(labels, le=format_value(bound))
+                    lines.append(
+                        f"{name}_bucket{format_labels(bucket_labels)} {cumulative}"
+                    )
+                lines.append(
+                    f"{name}_sum{format_labels(labels)} {format_value(value[-1])}"
+                )
+                lines.append(f"{name}_count{format_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{escape_label(value)}"' for key, value in labels.items())
+    return "{" + pairs + "}"
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(value)
@@ -0,0 +1,55 @@
+import queue
+import threading
+
+
+# In-process publish/subscribe for new notifications. Each open
+# /notifications/stream response holds one Subscription for its user.
+# Events only reach streams served by the same process; clients connected
+# to another worker pick them up when their stream reconnects with
+# Last-Event-ID (or through the conditional polling fallback).
+MAX_PENDING_EVENTS = 100
+
+
+class Subscription:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.events = queue.Queue(maxsize=MAX_PENDING_EVENTS)
+        # Set when the client falls too far behind; the stream then closes so
+        # the browser reconnects and resyncs from the database
+        self.overflowed = False
+
+    def get(self, timeout):
+        return self.events.get(timeout=timeout)
+
+
+class NotificationBus:
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        sub = Subscription(user_id)
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subscriptions.get(sub.user_id)
+            if subs:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscriptions[sub.user_id]
+
+    def publish(self, user_id, event):
+        with self._lock:
+            subs = list(self._subscriptions.get(user_id, ()))
+        for sub in subs:
+            try:
+                sub.events.put_nowait(event)
+            except queue.Full:
+                sub.overflowed = True
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subs) for subs in self._subscriptions.values())
@@ -0,0 +1,117 @@
+import base64
+import binascii
+import json
+
+
+# Keyset ("seek") pagination: instead of OFFSET, each page remembers the sort
+# key of its first and last row and the next query starts right after it,
+# so every page costs the same index range scan however deep it is.
+PAGE_SIZE = 24
+MAX_PAGE_SIZE = 96
+
+
+class Page:
+    def __init__(self, items, next_cursor, prev_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.has_next = next_cursor is not None
+        self.has_prev = prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, size):
+    # A malformed or foreign cursor just means "start from the first page"
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, binascii.Error):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+def page_limit(value):
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        return PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def keyset_sql(
+    select, from_, conditions, keys, descending=True, seek=False, backwards=False
+):
+    # The statement keyset_page runs: the listing's conditions, then the key
+    # values to seek past (if any), then the row limit as parameters
+    key_columns = ", ".join(f"{key} AS _page_key_{i}" for i, key in enumerate(keys))
+    conditions = list(conditions)
+    if seek:
+        # Moving towards the end of the listing means smaller keys when the
+        # listing is descending; going back to the previous page flips it
+        op = "<" if descending != backwards else ">"
+        conditions.append(f"({', '.join(keys)}) {op} ({', '.join('?' * len(keys))})")
+
+    query = f"SELECT {select}, {key_columns} FROM {from_}"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    direction = "DESC" if descending != backwards else "ASC"
+    query += " ORDER BY " + ", ".join(f"{key} {direction}" for key in keys)
+    return query + " LIMIT ?"
+
+
+def keyset_page(
+    db,
+    select,
+    from_,
+    conditions,
+    params,
+    keys,
+    descending=True,
+    after=None,
+    before=None,
+    limit=PAGE_SIZE,
+):
+    # keys: SQL expressions that together order rows uniquely (end with an id)
+    after_values = decode_cursor(after, len(keys))
+    before_values = decode_cursor(before, len(keys))
+    backwards = before_values is not None and after_values is None
+    seek = after_values if not backwards else before_values
+
+    query = keyset_sql(
+        select, from_, conditions, keys, descending, seek is not None, backwards
+    )
+    params = list(params)
+    if seek is not None:
+        params.extend(seek)
+    # One extra row tells whether there is another page in this direction
+    params.append(limit + 1)
+
+    rows = db.execute(query, tuple(params)).fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+
+    def cursor_for(row):
+        return encode_cursor([row[f"_page_key_{i}"] for i in range(len(keys))])
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if more or backwards:
+            next_cursor = cursor_for(rows[-1])
+        if (more and backwards) or (seek is not None and not backwards):
+            prev_cursor = cursor_for(rows[0])
+    return Page(rows, next_cursor, prev_cursor)
@@ -0,0 +1,167 @@
+import cProfile
+import logging
+import os
+import re
+import sqlite3
+import time
+from collections import Counter
+
+try:
+    import pyinstrument
+except ImportError:  # optional, cProfile is always available
+    pyinstrument = None
+
+
+# Per request SQL timing. Pooled connections are TimedConnections; while a
+# request holds one, its QueryRecorder sees every statement with how long it
+# took (execute plus fetching) and how many rows came back. Connections used
+# outside a request (job workers, CLI) have no recorder and run untimed.
+SLOW_QUERY_MS = float(os.environ.get("GRATIA_SLOW_QUERY_MS", "100"))
+# The same statement this many times in one request is most likely a query
+# inside a loop (N+1) that could be one JOIN or IN (...)
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("GRATIA_N_PLUS_ONE", "5"))
+# Opt-in profiling: GRATIA_PROFILE_DIR=/tmp/profiles writes one profile per
+# request, GRATIA_PROFILE_ENDPOINTS=dashboard,find_matches limits which ones
+PROFILE_DIR = os.environ.get("GRATIA_PROFILE_DIR")
+PROFILE_ENDPOINTS = {
+    name for name in os.environ.get("GRATIA_PROFILE_ENDPOINTS", "").split(",") if name
+}
+PROFILER = os.environ.get("GRATIA_PROFILER", "cprofile")  # or "pyinstrument"
+
+log = logging.getLogger("gratia.sql")
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(statement):
+    return WHITESPACE.sub(" ", statement).strip()
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []  # [sql, seconds, rows]
+
+    def start(self, statement):
+        entry = [normalize_sql(statement), 0.0, 0]
+        self.queries.append(entry)
+        return entry
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def sql_seconds(self):
+        return sum(entry[1] for entry in self.queries)
+
+    def repeated(self, threshold=N_PLUS_ONE_THRESHOLD):
+        # Statements run at least threshold times, most repeated first
+        counts = Counter(entry[0] for entry in self.queries)
+        return [(sql, n) for sql, n in counts.most_common() if n >= threshold]
+
+    def slow(self, threshold_ms=SLOW_QUERY_MS):
+        return [entry for entry in self.queries if entry[1] * 1000 >= threshold_ms]
+
+    def server_timing(self):
+        total_ms = (time.perf_counter() - self.started) * 1000
+        return (
+            f'db;dur={self.sql_seconds * 1000:.1f};desc="{self.count} queries", '
+            f"total;dur={total_ms:.1f}"
+        )
+
+    def report(self, endpoint):
+        # Slow statements and likely N+1 loops go to the "gratia.sql" log
+        for statement, seconds, rows in self.slow():
+            log.warning(
+                "slow query in %s: %.1f ms, %d rows: %s",
+                endpoint,
+                seconds * 1000,
+                rows,
+                statement,
+            )
+        for statement, n in self.repeated():
+            log.warning("possible N+1 in %s: %d x %s", endpoint, n, statement)
+
+
+class TimedCursor(sqlite3.Cursor):
+    entry = None
+
+    def _timed(self, fetch, *args):
+        if self.entry is None:
+            return fetch(*args)
+        t0 = time.perf_counter()
+        result = fetch(*args)
+        self.entry[1] += time.perf_counter() - t0
+        if isinstance(result, list):
+            self.entry[2] += len(result)
+        elif result is not None:
+            self.entry[2] += 1
+        return result
+
+    def fetchone(self):
+        return self._timed(super().fetchone)
+
+    def fetchmany(self, size=None):
+        if size is None:
+            return self._timed(super().fetchmany)
+        return self._timed(super().fetchmany, size)
+
+    def fetchall(self):
+        return self._timed(super().fetchall)
+
+    def __next__(self):
+        return self._timed(super().__next__)
+
+
+class TimedConnection(sqlite3.Connection):
+    recorder = None
+
+    def _run(self, method, statement, *args):
+        if self.recorder is None:
+            return getattr(super(), method)(statement, *args)
+        cursor = self.cursor(TimedCursor)
+        entry = cursor.entry = self.recorder.start(statement)
+        t0 = time.perf_counter()
+        try:
+            getattr(cursor, method)(statement, *args)
+        finally:
+            entry[1] += time.perf_counter() - t0
+        return cursor
+
+    def execute(self, statement, *args):
+        return self._run("execute", statement, *args)
+
+    def executemany(self, statement, *args):
+        return self._run("executemany", statement, *args)
+
+
+# ----------------- PROFILER -----------------
+def profiling_enabled(endpoint):
+    return bool(PROFILE_DIR) and (
+        not PROFILE_ENDPOINTS or endpoint in PROFILE_ENDPOINTS
+    )
+
+
+def start_profiler():
+    if PROFILER == "pyinstrument" and pyinstrument is not None:
+        profiler = pyinstrument.Profiler()
+        profiler.start()
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return profiler
+
+
+def dump_profile(profiler, endpoint):
+    # <endpoint>-<epoch ms>.prof (cProfile, open with pstats/snakeviz) or
+    # .html (pyinstrument)
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = os.path.join(PROFILE_DIR, f"{endpoint}-{int(time.time() * 1000)}")
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+        profiler.dump_stats(name + ".prof")
+        return name + ".prof"
+    profiler.stop()
+    with open(name + ".html", "w") as f:
+        f.write(profiler.output_html())
+    return name + ".html"
@@ -0,0 +1,195 @@
+# SQL run by the hot routes. main.py and the helper modules execute these
+# statements and 'flask --app main check-plans' (database_manager.HOT_QUERIES)
+# explains the very same ones, so an index regression shows up there.
+# Keyset listings are given as keyword arguments for pagination.keyset_page,
+# which builds their SQL (pagination.keyset_sql).
+
+# ----------------- USERS -----------------
+USER_BY_ID = "SELECT * FROM Users WHERE user_id=?"
+USER_BY_EMAIL = "SELECT * FROM Users WHERE email=?"
+RESET_TOKEN = (
+    "SELECT * FROM PasswordResetTokens WHERE token_hash=? AND used=0 AND expires_at>?"
+)
+USER_STATS = "SELECT * FROM UserStats WHERE user_id=?"
+PREFERENCES = "SELECT category FROM Preferences WHERE user_id = ?"
+
+# ----------------- DATA VERSIONS -----------------
+DATA_VERSION = "SELECT version FROM DataVersions WHERE name = ?"
+USER_DATA_VERSION = "SELECT version FROM UserDataVersions WHERE user_id = ?"
+
+# ----------------- DASHBOARD -----------------
+DONOR_RECENT = """
+    SELECT items, COALESCE(status, 'Available') AS status
+    FROM Donations
+    WHERE donor_id = ?
+    ORDER BY donation_id DESC
+    LIMIT 5
+"""
+RECIPIENT_RECENT = """
+    SELECT items, status
+    FROM Donations
+    WHERE claimed_by = ?
+    ORDER BY donation_id DESC
+    LIMIT 5
+"""
+
+# ----------------- LISTINGS -----------------
+MY_DONATIONS = {
+    "select": "d.*, u.name AS recipient_name",
+    "from_": "Donations d LEFT JOIN Users u ON d.recipient_id = u.user_id",
+    "conditions": ["d.donor_id = ?"],
+    "keys": ["d.donation_id"],
+}
+MY_REQUESTS = {
+    "select": "d.*, u.name AS donor_name",
+    "from_": "Donations d LEFT JOIN Users u ON d.donor_id = u.user_id",
+    "conditions": ["d.recipient_id = ?"],
+    "keys": ["d.donation_id"],
+}
+# Available donations the recipient hasn't asked for and isn't waiting for.
+# Parameters: recipient (join), recipient (queue), then any extra conditions.
+FIND_MATCHES = {
+    "select": "d.*, u.name AS donor_name",
+    "from_": """
+        AvailableDonations a
+        JOIN Donations d ON d.donation_id = a.donation_id
+        JOIN Users u ON d.donor_id = u.user_id
+        LEFT JOIN Matches m ON m.donation_id = a.donation_id AND m.recipient_id = ?
+    """,
+    "conditions": [
+        "m.match_id IS NULL",
+        """NOT EXISTS (
+            SELECT 1 FROM ClaimQueue q
+            WHERE q.donation_id = a.donation_id AND q.recipient_id = ?
+        )""",
+    ],
+    "keys": ["a.date_donated", "a.donation_id"],
+}
+FIND_MATCHES_SINCE = "a.date_donated >= ?"
+CATALOGUE = {
+    "select": "d.*",
+    "from_": "Donations d",
+    "conditions": [],
+    "keys": ["d.date_donated", "d.donation_id"],
+}
+# bm25 is lower for better matches, so the search pages ascending
+CATALOGUE_SEARCH = {
+    "select": "d.*",
+    "from_": "DonationsSearch JOIN Donations d ON d.donation_id = DonationsSearch.rowid",
+    "conditions": ["DonationsSearch MATCH ?"],
+    "keys": ["bm25(DonationsSearch, 2.0, 1.0)", "d.donation_id"],
+    "descending": False,
+}
+CATALOGUE_CATEGORY = "d.category = ?"
+CATALOGUE_SINCE = "d.date_donated >= ?"
+
+# ----------------- MATCHES -----------------
+DONOR_MATCHES = """
+    SELECT m.match_id, m.donation_id, m.status, m.donor_completed, m.recipient_completed,
+            d.items, d.category, d.image_url, d.image_variants,
+            u.name AS recipient_name, m.recipient_id, m.donor_completed, m.recipient_completed
+    FROM Matches m
+    JOIN Donations d ON m.donation_id = d.donation_id
+    JOIN Users u ON m.recipient_id = u.user_id
+    WHERE d.donor_id = ?
+    ORDER BY m.match_id DESC
+"""
+RECIPIENT_MATCHES = """
+    SELECT m.match_id, m.donation_id, m.status, m.donor_completed, m.recipient_completed,
+            d.items, d.category, d.image_url, d.image_variants,
+            u.name AS donor_name, d.donor_id
+    FROM Matches m
+    JOIN Donations d ON m.donation_id = d.donation_id
+    JOIN Users u ON d.donor_id = u.user_id
+    WHERE m.recipient_id = ?
+    ORDER BY m.match_id DESC
+"""
+MATCH_RESPOND = """
+    UPDATE Matches SET status = ?
+    WHERE match_id = ? AND status = 'Pending'
+        AND donation_id IN (
+            SELECT donation_id FROM Donations
+            WHERE donor_id = ?
+                AND (? = 'Rejected' OR status IS NULL OR status IN ('Available', 'Pending'))
+        )
+    RETURNING match_id, donation_id, recipient_id, status
+"""
+PLACE_IN_LINE = "SELECT COUNT(*) FROM ClaimQueue WHERE donation_id = ? AND position <= ?"
+QUEUED_CLAIMS = """
+    SELECT q.donation_id, q.queued_at, d.items, d.category, d.image_url,
+        d.image_variants, u.name AS donor_name,
+        (
+            SELECT COUNT(*) FROM ClaimQueue ahead
+            WHERE ahead.donation_id = q.donation_id AND ahead.position <= q.position
+        ) AS place
+    FROM ClaimQueue q
+    JOIN Donations d ON d.donation_id = q.donation_id
+    LEFT JOIN Users u ON u.user_id = d.donor_id
+    WHERE q.recipient_id = ?
+    ORDER BY q.queued_at, q.donation_id
+"""
+
+# ----------------- NOTIFICATIONS -----------------
+NOTIFICATION_FEED = """
+    SELECT id, message, created_at, read FROM Notifications
+    WHERE user_id=?
+    ORDER BY created_at DESC, id DESC
+    LIMIT ?
+"""
+NOTIFICATION_FEED_OLDER = """
+    SELECT id, message, created_at, read FROM Notifications
+    WHERE user_id=? AND (created_at, id) < (?, ?)
+    ORDER BY created_at DESC, id DESC
+    LIMIT ?
+"""
+NOTIFICATION_CURSOR = "SELECT created_at, id FROM Notifications WHERE id=? AND user_id=?"
+NOTIFICATIONS_AFTER = """
+    SELECT id, message, created_at, read FROM Notifications
+    WHERE user_id=? AND (created_at, id) > (?, ?)
+    ORDER BY created_at, id
+    LIMIT ?
+"""
+UNREAD_NOTIFICATIONS = """
+    SELECT COUNT(*) AS unread
+    FROM (SELECT 1 FROM Notifications WHERE user_id=? AND read=0 LIMIT ?)
+"""
+
+# ----------------- LOCATIONS -----------------
+NEARBY_DONATIONS = """
+    SELECT d.*, u.name AS donor_name
+    FROM AvailableDonationLocations
+    JOIN Donations d ON d.donation_id = AvailableDonationLocations.donation_id
+    JOIN Users u ON d.donor_id = u.user_id
+    LEFT JOIN Matches m ON m.donation_id = d.donation_id AND m.recipient_id = ?
+    WHERE AvailableDonationLocations.max_lat >= ?
+        AND AvailableDonationLocations.min_lat <= ?
+        AND AvailableDonationLocations.max_lon >= ?
+        AND AvailableDonationLocations.min_lon <= ?
+        AND m.match_id IS NULL
+        AND NOT EXISTS (
+            SELECT 1 FROM ClaimQueue q
+            WHERE q.donation_id = d.donation_id AND q.recipient_id = ?
+        )
+"""
+
+# ----------------- LEADERBOARD -----------------
+TOP_DONORS = """
+    SELECT p.user_id, u.name, u.public_profile,
+        SUM(p.donations) AS donations, SUM(p.points) AS points
+    FROM DonorDailyPoints p
+    JOIN Users u ON u.user_id = p.user_id
+    WHERE p.day >= ? AND p.day < ?
+    GROUP BY p.user_id
+    HAVING SUM(p.points) > 0
+    ORDER BY points DESC, donations DESC, p.user_id
+    LIMIT ?
+"""
+USER_POINTS = """
+    SELECT
+        COALESCE(SUM(points), 0) AS total,
+        COALESCE(SUM(CASE WHEN day >= ? AND day < ? THEN points END), 0) AS weekly,
+        COALESCE(SUM(CASE WHEN day >= ? AND day < ? THEN points END), 0) AS monthly,
+        COALESCE(SUM(donations), 0) AS donations
+    FROM DonorDailyPoints
+    WHERE user_id = ?
+"""
@@ -1,7 +1,8 @@
-if ("serviceworker" in navigator) {
+if ("serviceWorker" in navigator) {
   window.addEventListener("load", function () {
-    navigator.serviceworker
-      .register("static/js/serviceworker.js")
+    // Registered from the site root so its scope covers every page
+    navigator.serviceWorker
+      .register("/serviceworker.js", { scope: "/" })
       .then((res) => console.log("service worker registered"))
       .catch((err) => console.log("service worker not registered", err));
   });
@@ -1,59 +1,103 @@
-const assets = [
-  "/",
-  "static/css/style.css",
-  "static/js/app.js",
-  "static/images/logo.png",
-  "static/images/favicon.png",
-  "static/icons/icon-128x128.png",
-  "static/icons/icon-192x192.png",
-  "static/icons/icon-384x384.png",
-  "static/icons/icon-512x512.png",
-  "static/icons/desktop_screenshot.png",
-  "static/icons/mobile_screenshot.png",
-  "static/Images/placeholder.png"
-];
-
-const CATALOGUE_ASSETS = "catalogue-assets";
-
-self.addEventListener("install", (installEvt) => {
-  installEvt.waitUntil(
+// Served from /serviceworker.js so it controls the whole site.
+// 'flask --app main build-assets' fills in PRECACHE with the fingerprinted
+// URLs of the app shell; without a build nothing is precached.
+const PRECACHE = /* precache */ { version: "dev", urls: [] };
+
+const PRECACHE_CACHE = `gratia-precache-${PRECACHE.version}`;
+// Bump these when the way pages or uploads are cached changes
+const PAGES_CACHE = "gratia-pages-v1";
+const UPLOADS_CACHE = "gratia-uploads-v1";
+const CURRENT_CACHES = [PRECACHE_CACHE, PAGES_CACHE, UPLOADS_CACHE];
+
+const MAX_UPLOADS = 150;
+// Listings that may be shown from cache while a fresh copy is fetched
+const STALE_WHILE_REVALIDATE = ["/donations"];
+
+self.addEventListener("install", (event) => {
+  // Only take over once every shell file is cached; a failed download
+  // fails the install and the old worker keeps running
+  event.waitUntil(
     caches
-      .open(CATALOGUE_ASSETS)
-      .then((cache) => {
-        console.log(cache);
-        cache.addAll(assets);
-      })
-      .then(self.skipWaiting())
-      .catch((e) => {
-        console.log(e);
-      })
+      .open(PRECACHE_CACHE)
+      .then((cache) => cache.addAll(PRECACHE.urls))
+      .then(() => self.skipWaiting())
   );
 });
 
-self.addEventListener("activate", function (evt) {
-  evt.waitUntil(
+self.addEventListener("activate", (event) => {
+  // Drop caches left by older workers (including old precache versions)
+  event.waitUntil(
     caches
       .keys()
-      .then((keyList) => {
-        return Promise.all(
-          keyList.map((key) => {
-            if (key === CATALOGUE_ASSETS) {
-              console.log("Removed old cache from", key);
-              return caches.delete(key);
-            }
-          })
-        );
-      })
+      .then((keys) =>
+        Promise.all(
+          keys
+            .filter((key) => !CURRENT_CACHES.includes(key))
+            .map((key) => caches.delete(key))
+        )
+      )
       .then(() => self.clients.claim())
   );
 });
 
-self.addEventListener("fetch", function (evt) {
-  evt.respondWith(
-    fetch(evt.request).catch(() => {
-      return caches.open(CATALOGUE_ASSETS).then((cache) => {
-        return cache.match(evt.request);
-      });
-    })
-  );
+self.addEventListener("fetch", (event) => {
+  const request = event.request;
+  if (request.method !== "GET") return;
+  const url = new URL(request.url);
+  if (url.origin !== self.location.origin) return;
+
+  if (url.pathname === "/signout") {
+    // Cached pages belong to the signed in user
+    event.waitUntil(caches.delete(PAGES_CACHE));
+    return;
+  }
+  if (url.pathname.startsWith("/static/dist/")) {
+    event.respondWith(cacheFirst(request, PRECACHE_CACHE));
+  } else if (url.pathname.startsWith("/static/uploads/")) {
+    // Upload names are content hashes, so a cached copy never goes stale
+    event.respondWith(cacheFirst(request, UPLOADS_CACHE, MAX_UPLOADS));
+  } else if (STALE_WHILE_REVALIDATE.includes(url.pathname)) {
+    event.respondWith(staleWhileRevalidate(event, PAGES_CACHE));
+  }
+  // Everything else goes straight to the network
 });
+
+function cacheable(response) {
+  // Redirects (e.g. to sign in) and errors are never stored
+  return response.ok && !response.redirected && response.type === "basic";
+}
+
+async function cacheFirst(request, cacheName, maxEntries) {
+  const cache = await caches.open(cacheName);
+  const cached = await cache.match(request);
+  if (cached) return cached;
+  const response = await fetch(request);
+  if (cacheable(response)) {
+    await cache.put(request, response.clone());
+    if (maxEntries) await trimCache(cache, maxEntries);
+  }
+  return response;
+}
+
+async function staleWhileRevalidate(event, cacheName) {
+  const cache = await caches.open(cacheName);
+  const cached = await cache.match(event.request);
+  const network = fetch(event.request).then(async (response) => {
+    if (cacheable(response)) await cache.put(event.request, response.clone());
+    return response;
+  });
+  if (cached) {
+    // Answer from cache now, refresh it in the background
+    event.waitUntil(network.catch(() => {}));
+    return cached;
+  }
+  return network;
+}
+
+async function trimCache(cache, maxEntries) {
+  // Keys come back in insertion order, so the oldest entries go first
+  const keys = await cache.keys();
+  await Promise.all(
+    keys.slice(0, Math.max(0, keys.length - maxEntries)).map((key) => cache.delete(key))
+  );
+}
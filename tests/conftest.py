@@ -0,0 +1,101 @@
+import os
+import shutil
+import sys
+import uuid
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database_manager  # noqa: E402
+
+
+@pytest.fixture
+def database(tmp_path):
+    # A copy of the bundled database, brought up to the current schema
+    path = str(tmp_path / "gratia.db")
+    shutil.copy(os.path.join(ROOT, "database", "data_source.db"), path)
+    database_manager.migrate(path)
+    return path
+
+
+@pytest.fixture
+def connect(database):
+    pool = database_manager.ConnectionPool(database)
+    connections = []
+
+    def _connect():
+        con = pool.connect()
+        connections.append(con)
+        return con
+
+    yield _connect
+    for con in connections:
+        con.close()
+
+
+@pytest.fixture
+def db(connect):
+    return connect()
+
+
+def add_user(db, role):
+    user_id = str(uuid.uuid4())
+    db.execute(
+        "INSERT INTO Users (user_id, name, email, password, role) VALUES (?, ?, ?, '', ?)",
+        (user_id, f"{role} {user_id[:8]}", f"{user_id}@example.com", role),
+    )
+    db.commit()
+    return user_id
+
+
+def add_donation(db, donor_id):
+    donation_id = db.execute(
+        "INSERT INTO Donations (donor_id, items, category, status) "
+        "VALUES (?, 'Tinned soup', 'Food', 'Available')",
+        (donor_id,),
+    ).lastrowid
+    db.commit()
+    return donation_id
+
+
+@pytest.fixture
+def donor(db):
+    return add_user(db, "Donor")
+
+
+@pytest.fixture
+def recipients(db):
+    return [add_user(db, "Recipient") for _ in range(3)]
+
+
+@pytest.fixture
+def donation(db, donor):
+    return add_donation(db, donor)
+
+
+
+@pytest.fixture(scope="session")
+def main(tmp_path_factory):
+    # main reads its database path when imported, so import it once against
+    # its own migrated copy
+    path = str(tmp_path_factory.mktemp("app") / "gratia.db")
+    shutil.copy(os.path.join(ROOT, "database", "data_source.db"), path)
+    os.environ["GRATIA_DATABASE"] = path
+    os.environ["GRATIA_JOB_WORKERS"] = "0"
+    import main
+
+    return main
+
+
+@pytest.fixture
+def app_db(main):
+    con = database_manager.ConnectionPool(main.DATABASE).connect()
+    yield con
+    con.close()
+
+
+def login(client, user_id):
+    with client.session_transaction() as session:
+        session["user_id"] = user_id
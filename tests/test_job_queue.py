@@ -0,0 +1,19 @@
+from conftest import add_donation, add_user, login
+
+
+def test_workers_are_woken_after_the_commit(main, app_db, monkeypatch):
+    donation_id = add_donation(app_db, add_user(app_db, "Donor"))
+    recipient_id = add_user(app_db, "Recipient")
+    client = main.app.test_client()
+    login(client, recipient_id)
+    queued = "SELECT COUNT(*) FROM Jobs WHERE kind = 'notify' AND status = 'queued'"
+    before = app_db.execute(queued).fetchone()[0]
+    seen = []
+
+    # What a worker woken now would find from its own connection
+    monkeypatch.setattr(
+        main.job_queue, "wake", lambda: seen.append(app_db.execute(queued).fetchone()[0])
+    )
+    response = client.post("/find_matches", data={"donation_id": donation_id})
+    assert response.status_code == 302
+    assert seen == [before + 1]
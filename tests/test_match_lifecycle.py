@@ -0,0 +1,240 @@
+import threading
+
+import database_manager
+import geo
+import match_lifecycle
+from match_lifecycle import write_transaction
+
+
+def claim(db, donation_id, recipient_id):
+    with write_transaction(db):
+        return match_lifecycle.claim(db, donation_id, recipient_id, "2025-01-01 00:00:00")
+
+
+def respond(db, match_id, donor_id, status):
+    with write_transaction(db):
+        return match_lifecycle.respond(db, match_id, donor_id, status)
+
+
+def complete(db, match_id, user_id, role):
+    with write_transaction(db):
+        return match_lifecycle.complete(db, match_id, user_id, role)
+
+
+def matches(db, donation_id):
+    return [
+        tuple(row)
+        for row in db.execute(
+            "SELECT recipient_id, status FROM Matches WHERE donation_id = ? ORDER BY match_id",
+            (donation_id,),
+        )
+    ]
+
+
+def queue(db, donation_id):
+    return [
+        row[0]
+        for row in db.execute(
+            "SELECT recipient_id FROM ClaimQueue WHERE donation_id = ? ORDER BY position",
+            (donation_id,),
+        )
+    ]
+
+
+def test_concurrent_claims_one_pending_one_queued(connect, db, donation, recipients):
+    first, second = recipients[:2]
+    barrier = threading.Barrier(2)
+    places = {}
+
+    def worker(recipient_id):
+        con = connect()
+        barrier.wait()
+        places[recipient_id] = claim(con, donation, recipient_id)
+
+    threads = [threading.Thread(target=worker, args=(r,)) for r in (first, second)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(places.values()) == [0, 1]
+    holder = min(places, key=places.get)
+    waiting = max(places, key=places.get)
+    assert matches(db, donation) == [(holder, "Pending")]
+    assert queue(db, donation) == [waiting]
+
+
+def test_claim_twice_is_refused(db, donation, recipients):
+    assert claim(db, donation, recipients[0]) == 0
+    assert claim(db, donation, recipients[0]) is None
+    assert claim(db, donation, recipients[1]) == 1
+    assert claim(db, donation, recipients[1]) is None
+    assert len(matches(db, donation)) == 1
+
+
+def test_donor_cannot_claim_own_donation(db, donation, donor):
+    assert claim(db, donation, donor) is None
+
+
+def test_repeated_accept_and_reject(db, donation, donor, recipients):
+    claim(db, donation, recipients[0])
+    match = match_lifecycle.active_match(db, donation)
+
+    assert respond(db, match["match_id"], donor, "Accepted")["status"] == "Accepted"
+    assert respond(db, match["match_id"], donor, "Accepted") is None
+    assert respond(db, match["match_id"], donor, "Rejected") is None
+    assert matches(db, donation) == [(recipients[0], "Accepted")]
+    row = db.execute(
+        "SELECT status, recipient_id FROM Donations WHERE donation_id = ?", (donation,)
+    ).fetchone()
+    assert tuple(row) == ("Requested", recipients[0])
+
+
+def test_only_the_donor_can_respond(db, donation, recipients):
+    claim(db, donation, recipients[0])
+    match = match_lifecycle.active_match(db, donation)
+    assert respond(db, match["match_id"], recipients[0], "Accepted") is None
+    assert respond(db, match["match_id"], recipients[0], "Completed") is None
+    assert matches(db, donation) == [(recipients[0], "Pending")]
+
+
+def test_reject_promotes_next_in_line(db, donation, donor, recipients):
+    first, second, third = recipients
+    assert [claim(db, donation, r) for r in recipients] == [0, 1, 2]
+
+    match = match_lifecycle.active_match(db, donation)
+    assert match_lifecycle.waiting_recipients(db, match["match_id"]) == [second, third]
+    assert respond(db, match["match_id"], donor, "Rejected")["status"] == "Rejected"
+    assert respond(db, match["match_id"], donor, "Rejected") is None
+
+    assert matches(db, donation) == [(first, "Rejected"), (second, "Pending")]
+    assert queue(db, donation) == [third]
+    position = db.execute(
+        "SELECT position FROM ClaimQueue WHERE donation_id = ? AND recipient_id = ?",
+        (donation, third),
+    ).fetchone()[0]
+    assert match_lifecycle.place_in_line(db, donation, position) == 1
+
+    # A rejected recipient can't join the line again
+    assert claim(db, donation, first) is None
+
+
+def test_accept_clears_the_queue(db, donation, donor, recipients):
+    for recipient_id in recipients:
+        claim(db, donation, recipient_id)
+    match = match_lifecycle.active_match(db, donation)
+    respond(db, match["match_id"], donor, "Accepted")
+    assert queue(db, donation) == []
+    assert claim(db, donation, recipients[1]) is None
+    assert matches(db, donation) == [(recipients[0], "Accepted")]
+
+
+def test_complete_needs_both_sides(db, donation, donor, recipients):
+    claim(db, donation, recipients[0])
+    match_id = match_lifecycle.active_match(db, donation)["match_id"]
+
+    # Nothing to complete until the donor accepts
+    assert complete(db, match_id, donor, "Donor") is None
+    respond(db, match_id, donor, "Accepted")
+
+    assert complete(db, match_id, recipients[1], "Recipient") is None
+    assert complete(db, match_id, donor, "Donor")["status"] == "Accepted"
+    assert complete(db, match_id, donor, "Donor") is None
+    assert complete(db, match_id, recipients[0], "Recipient")["status"] == "Completed"
+    assert complete(db, match_id, recipients[0], "Recipient") is None
+    row = db.execute(
+        "SELECT donor_completed, recipient_completed, status FROM Matches WHERE match_id = ?",
+        (match_id,),
+    ).fetchone()
+    assert tuple(row) == (1, 1, "Completed")
+
+
+def test_complete_recipient_first(db, donation, donor, recipients):
+    claim(db, donation, recipients[0])
+    match_id = match_lifecycle.active_match(db, donation)["match_id"]
+    respond(db, match_id, donor, "Accepted")
+
+    assert complete(db, match_id, recipients[0], "Recipient")["status"] == "Accepted"
+    assert complete(db, match_id, donor, "Donor")["status"] == "Completed"
+
+
+def test_accept_after_mark_donated_is_refused(db, donation, donor, recipients):
+    claim(db, donation, recipients[0])
+    claim(db, donation, recipients[1])
+    match_id = match_lifecycle.active_match(db, donation)["match_id"]
+
+    with write_transaction(db):
+        marked, rejected = match_lifecycle.mark_donated(db, donation, donor)
+    assert marked["donation_id"] == donation
+    assert rejected == recipients[0]
+    assert respond(db, match_id, donor, "Accepted") is None
+
+    # Nobody was promoted and the donation kept its status and its points
+    assert matches(db, donation) == [(recipients[0], "Rejected")]
+    assert queue(db, donation) == []
+    row = db.execute(
+        "SELECT status, recipient_id FROM Donations WHERE donation_id = ?", (donation,)
+    ).fetchone()
+    assert tuple(row) == ("Donated", None)
+    row = db.execute(
+        "SELECT donations, points FROM DonorDailyPoints WHERE user_id = ?", (donor,)
+    ).fetchone()
+    assert tuple(row) == (1, 10)
+
+
+def test_mark_donated_needs_the_donor(db, donation, recipients):
+    claim(db, donation, recipients[0])
+    with write_transaction(db):
+        assert match_lifecycle.mark_donated(db, donation, recipients[0]) == (None, None)
+    assert matches(db, donation) == [(recipients[0], "Pending")]
+
+
+def test_accept_guard_in_trigger(db, donation, donor, recipients):
+    # Even a direct update can't hand over a donation that's already gone
+    claim(db, donation, recipients[0])
+    db.execute("UPDATE Donations SET status = 'Donated' WHERE donation_id = ?", (donation,))
+    db.execute("UPDATE Matches SET status = 'Accepted' WHERE donation_id = ?", (donation,))
+    db.commit()
+    row = db.execute(
+        "SELECT status, recipient_id FROM Donations WHERE donation_id = ?", (donation,)
+    ).fetchone()
+    assert tuple(row) == ("Donated", None)
+
+
+def test_queued_claims_and_leaving_the_queue(db, donation, recipients):
+    first, second, third = recipients
+    for recipient_id in recipients:
+        claim(db, donation, recipient_id)
+    assert match_lifecycle.queued_claims(db, first) == []
+    assert [row["place"] for row in match_lifecycle.queued_claims(db, third)] == [2]
+    version = database_manager.user_data_version(db, third)
+
+    with write_transaction(db):
+        assert match_lifecycle.leave_queue(db, donation, second)["donation_id"] == donation
+        assert match_lifecycle.leave_queue(db, donation, second) is None
+    assert queue(db, donation) == [third]
+    assert [row["place"] for row in match_lifecycle.queued_claims(db, third)] == [1]
+    # third moved up, so their cached pages are stale
+    assert database_manager.user_data_version(db, third) > version
+
+    # Having left, second can line up again at the back
+    assert claim(db, donation, second) == 2
+
+
+def test_nearby_leaves_out_queued_donations(db, donation, recipients):
+    db.execute(
+        "UPDATE Donations SET latitude = -33.8915, longitude = 151.2767 WHERE donation_id = ?",
+        (donation,),
+    )
+    db.commit()
+
+    def nearby(recipient_id):
+        rows = geo.nearby_donations(db, -33.8915, 151.2767, 1, 100, recipient_id)
+        return donation in [row["donation_id"] for row in rows]
+
+    assert nearby(recipients[1])
+    claim(db, donation, recipients[0])
+    claim(db, donation, recipients[1])
+    assert not nearby(recipients[0])
+    assert not nearby(recipients[1])
+    assert nearby(recipients[2])
@@ -0,0 +1,25 @@
+import database_manager
+from conftest import add_donation, add_user
+
+
+def test_dates_are_backfilled_once(database, db):
+    donation_id = add_donation(db, add_user(db, "Donor"))
+    db.execute(
+        "UPDATE Donations SET date_donated = '03/02/24 10:00' WHERE donation_id = ?",
+        (donation_id,),
+    )
+    db.commit()
+
+    # Nothing left to migrate, so startup leaves the rows to the CLI
+    assert database_manager.migrate(database) == []
+    row = db.execute(
+        "SELECT date_donated FROM Donations WHERE donation_id = ?", (donation_id,)
+    ).fetchone()
+    assert row[0] == "03/02/24 10:00"
+
+    converted, unparsed = database_manager.backfill_dates(db)
+    assert converted["Donations"] == 1 and unparsed == []
+    row = db.execute(
+        "SELECT date_donated FROM Donations WHERE donation_id = ?", (donation_id,)
+    ).fetchone()
+    assert row[0] == "2024-02-03 10:00:00"
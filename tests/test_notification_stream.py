@@ -0,0 +1,48 @@
+from conftest import add_user, login
+
+
+def test_dropped_stream_unsubscribes(main, app_db):
+    bus = main.notification_bus
+    client = main.app.test_client()
+    login(client, add_user(app_db, "Recipient"))
+
+    response = client.get("/notifications/stream", buffered=False)
+    assert response.status_code == 200
+    assert bus.subscriber_count() == 1
+    # Closed before the first chunk was read
+    response.close()
+    assert bus.subscriber_count() == 0
+
+
+def test_started_stream_unsubscribes(main, app_db):
+    bus = main.notification_bus
+    client = main.app.test_client()
+    login(client, add_user(app_db, "Recipient"))
+
+    response = client.get("/notifications/stream", buffered=False)
+    assert next(response.response).startswith(b"retry:")
+    response.close()
+    assert bus.subscriber_count() == 0
+
+
+def test_head_request_unsubscribes(main, app_db):
+    client = main.app.test_client()
+    login(client, add_user(app_db, "Recipient"))
+
+    # The server closes the response without ever iterating the body
+    client.head("/notifications/stream").close()
+    assert main.notification_bus.subscriber_count() == 0
+
+
+def test_failed_backlog_unsubscribes(main, app_db, monkeypatch):
+    client = main.app.test_client()
+    login(client, add_user(app_db, "Recipient"))
+
+    def broken(user_id, last_id):
+        raise RuntimeError("database gone")
+
+    monkeypatch.setattr(main, "notifications_after", broken)
+    monkeypatch.setattr(main.app, "testing", False)
+    response = client.get("/notifications/stream?last_id=1")
+    assert response.status_code == 500
+    assert main.notification_bus.subscriber_count() == 0
@@ -0,0 +1,19 @@
+import pytest
+
+import profiling
+
+
+def test_profile_is_written_when_the_view_raises(main, monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "PROFILER", "cprofile")
+    # Let the exception reach the test client instead of becoming a 500
+    monkeypatch.setattr(main.app, "testing", True)
+
+    def broken():
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(main.app.view_functions, "about", broken)
+    with pytest.raises(RuntimeError):
+        main.app.test_client().get("/about")
+
+    assert [path.name.split("-")[0] for path in tmp_path.iterdir()] == ["about"]
@@ -0,0 +1,100 @@
+import hashlib
+import os
+import tempfile
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional, without it only originals are served
+    Image = None
+
+
+# Uploaded images are stored under the SHA-256 of their content, so the same
+# picture uploaded twice is kept once. Resized variants are generated later by
+# a job (see the "image_variants" handler in main.py):
+#   <hash>-thumb.<ext> / .webp   for catalogue grids and cards
+#   <hash>-large.<ext> / .webp   for full size views
+CHUNK_SIZE = 64 * 1024
+VARIANT_SIZES = {"thumb": (400, 400), "large": (1280, 1280)}
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+
+def save_upload(file_storage, upload_dir, extension):
+    # Copy the upload in chunks while hashing it, then move it into place
+    # under its content name unless that file already exists
+    os.makedirs(upload_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=upload_dir, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            while True:
+                chunk = file_storage.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                tmp.write(chunk)
+        content_hash = digest.hexdigest()
+        filename = f"{content_hash}.{extension}"
+        path = os.path.join(upload_dir, filename)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return filename
+
+
+def variant_name(filename, variant, extension):
+    stem = filename.rsplit(".", 1)[0]
+    return f"{stem}-{variant}.{extension}"
+
+
+def build_variants(upload_dir, filename):
+    # Returns {"thumb": name, "thumb_webp": name, "large": ..., "large_webp": ...}
+    # for the files that exist; already generated files are reused
+    if Image is None:
+        return {}
+    with Image.open(os.path.join(upload_dir, filename)) as original:
+        original = ImageOps.exif_transpose(original)
+        has_alpha = original.mode in ("RGBA", "LA", "P")
+        fallback_ext = "png" if has_alpha else "jpg"
+        variants = {}
+        for variant, size in VARIANT_SIZES.items():
+            image = original.copy()
+            image.thumbnail(size)
+            image = image.convert("RGBA" if has_alpha else "RGB")
+
+            name = variant_name(filename, variant, fallback_ext)
+            if fallback_ext == "jpg":
+                save_image(
+                    image,
+                    upload_dir,
+                    name,
+                    "JPEG",
+                    quality=JPEG_QUALITY,
+                    optimize=True,
+                    progressive=True,
+                )
+            else:
+                save_image(image, upload_dir, name, "PNG", optimize=True)
+            variants[variant] = name
+
+            webp_name = variant_name(filename, variant, "webp")
+            save_image(
+                image, upload_dir, webp_name, "WEBP", quality=WEBP_QUALITY, method=4
+            )
+            variants[f"{variant}_webp"] = webp_name
+    return variants
+
+
+def save_image(image, upload_dir, name, image_format, **options):
+    # Written beside the target and renamed, so no one is served half a file
+    path = os.path.join(upload_dir, name)
+    if os.path.exists(path):
+        return
+    tmp_path = path + ".part"
+    image.save(tmp_path, image_format, **options)
+    os.replace(tmp_path, path)